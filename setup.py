@@ -51,6 +51,7 @@ setup(
     extras_require={
         'test': test_requirements,
         'canvas': ['numpy'],
+        'zstd': ['zstandard'],
     },
 )
 
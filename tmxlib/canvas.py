@@ -18,6 +18,7 @@ except ImportError:  # pragma: no cover
     raise ImportError('The PIL library (Pillow on PyPI) is needed for Canvas')
 
 from tmxlib.image_pil import PilImage
+from tmxlib.tile import TileLikeObject
 
 
 class Canvas(PilImage):
@@ -43,6 +44,10 @@ class Canvas(PilImage):
         .. attribute:: color
 
             The initial color the canvas will have
+
+    Parts of immutable images (such as tiles of a tileset) are cropped out
+    of their image, and flipped, only once per Canvas; drawing the same tile
+    again reuses the cropped image.
     """
     size = 0, 0
     pil_image = None
@@ -57,6 +62,7 @@ class Canvas(PilImage):
             raise ValueError('invalid color: {0}'.format(color))
         self.pil_image = Image.new('RGBA', size,
                                    color=tuple(int(v * 256) for v in color))
+        self._pil_cache = {}
 
         for command in commands:
             command.draw(self)
@@ -106,34 +112,81 @@ class Canvas(PilImage):
             self.pil_image = Image.alpha_composite(self.pil_image,
                                                    t_image)
 
-    def draw_image(self, image, pos=(0, 0), opacity=1):
-        """Paste the given image at the given position
-        """
-        if not opacity:
-            return
-        x, y = pos
+    def _source_pil_image(self, image, flags=0):
+        """Return a PIL image with the contents of the given image
+
+        `flags` are flip flags to apply, as in tile values.
 
+        Crops, transformations and conversions of immutable images are
+        cached.
+        Canvases (and regions of them) are mutable, so they are not cached.
+        """
         try:
             parent = image.parent
-            crop = True
         except AttributeError:
-            parent = image
-            crop = False
-        try:
+            # Whole image: nothing to crop
+            parent, box = image, None
+        else:
+            box = (image.x, image.y, image.x + image.width,
+                   image.y + image.height)
+        if isinstance(parent, Canvas):
             pil_image = parent.pil_image
-        except AttributeError:
-            input = BytesIO(parent._repr_png_())
+            if box:
+                pil_image = pil_image.crop(box)
+            return _transformed(pil_image, flags)
+        key = id(parent), box, flags
+        # The parent image is part of the value, so its id (in the key)
+        # is not reused while the cache entry exists
+        try:
+            return self._pil_cache[key][1]
+        except KeyError:
+            try:
+                pil_image = parent.pil_image
+            except AttributeError:
+                pil_image = self._converted_pil_image(parent)
+            if box:
+                pil_image = pil_image.crop(box)
+            pil_image = _transformed(pil_image, flags)
+            self._pil_cache[key] = parent, pil_image
+            return pil_image
+
+    def _converted_pil_image(self, image):
+        """Return a PIL image converted from a non-PIL immutable image"""
+        key = id(image)
+        try:
+            return self._pil_cache[key][1]
+        except KeyError:
+            input = BytesIO(image._repr_png_())
             pil_image = Image.open(input).convert('RGBA')
-        if crop:
-            pil_image = pil_image.crop((image.x, image.y,
-                                        image.x + image.width,
-                                        image.y + image.height))
+            self._pil_cache[key] = image, pil_image
+            return pil_image
 
-        if opacity == 1:
-            self.pil_image.paste(pil_image, (x, y), mask=pil_image)
-        else:
-            with self._opacity_layer(opacity) as ol:
-                ol.paste(pil_image, (x, y))
+    def draw_image(self, image, pos=(0, 0), opacity=1, flags=0):
+        """Paste the given image at the given position
+
+        `flags` are flip flags to apply to the image, as in the upper bits of
+        :attr:`tile values <tmxlib.tile.TileLikeObject.value>`.
+        """
+        self.draw_images([(image, pos, flags)], opacity=opacity)
+
+    def draw_images(self, items, opacity=1):
+        """Paste several images, given as (image, pos, flags) triples
+
+        See :meth:`draw_image` for the meaning of the values.
+        If `opacity` is not 1, the images are composed together first, and
+        the result is drawn with the given opacity.
+        """
+        if not opacity:
+            return
+        with self._opacity_layer(opacity) as ol:
+            for image, (x, y), flags in items:
+                pil_image = self._source_pil_image(image, flags)
+                if opacity == 1:
+                    ol.paste(pil_image, (x, y), mask=pil_image)
+                else:
+                    box = (x, y, x + pil_image.size[0], y + pil_image.size[1])
+                    below = ol.crop(box)
+                    ol.paste(Image.alpha_composite(below, pil_image), box)
 
     def draw_rectangle(self, pos, size, color, width=1, opacity=1):
         """Draw a rectangle
@@ -158,3 +211,17 @@ class Canvas(PilImage):
             draw = ImageDraw.Draw(ol)
             draw.rectangle((x, y, x + w, y + h),
                            fill=color)
+
+
+def _transformed(pil_image, flags):
+    """Return a PIL image with the given tile flip flags applied
+
+    The diagonal flip (transposition) is applied first, as in Tiled.
+    """
+    if flags & TileLikeObject.flipped_diagonally.value:
+        pil_image = pil_image.transpose(Image.TRANSPOSE)
+    if flags & TileLikeObject.flipped_horizontally.value:
+        pil_image = pil_image.transpose(Image.FLIP_LEFT_RIGHT)
+    if flags & TileLikeObject.flipped_vertically.value:
+        pil_image = pil_image.transpose(Image.FLIP_TOP_BOTTOM)
+    return pil_image
@@ -5,6 +5,27 @@ py3 = (sys.version_info >= (3, 0))
 if py3:  # pragma: no cover
     # ord: convert byte to int
     ord_ = lambda x: x
+
+    # array.array <-> bytes conversions
+    def array_frombytes(arr, data):
+        arr.frombytes(data)
+
+    def array_tobytes(arr):
+        return arr.tobytes()
+
+    # view of an object's raw memory, usable wherever bytes are expected
+    def bytes_view(obj):
+        return memoryview(obj).cast('B')
 else:
     # ord: convert byte to int
     ord_ = ord
+
+    # array.array <-> bytes conversions
+    def array_frombytes(arr, data):
+        arr.fromstring(data)
+
+    def array_tobytes(arr):
+        return arr.tostring()
+
+    # view of an object's raw memory, usable wherever bytes are expected
+    bytes_view = buffer
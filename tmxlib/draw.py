@@ -10,14 +10,19 @@ from __future__ import division
 from tmxlib import helpers
 
 
-class DrawCommand(object):
+class DrawCommand(helpers.SlotsPickleMixin):
     """A draw command
     """
+    __slots__ = ()
 
     def draw(self, canvas):
         """Apply this operation to the given Canvas"""
         raise NotImplementedError('DrawOperation.draw() is abstract')
 
+    def translated(self, offset):
+        """Return a copy of this command moved by the given (x, y) offset"""
+        raise NotImplementedError('DrawOperation.translated() is abstract')
+
 
 class DrawImageCommand(DrawCommand):
     """Command to draw an image
@@ -32,14 +37,96 @@ class DrawImageCommand(DrawCommand):
 
             Position at which to draw the image.
             Will also available as ``x`` and ``y`` attributes.
+
+        .. attribute:: opacity
+
+            The opacity of the image
+
+        .. attribute:: flags
+
+            Flip flags to apply to the image, as in the upper bits of
+            :attr:`tile values <tmxlib.tile.TileLikeObject.value>`
     """
+    __slots__ = ('image', 'pos', 'opacity', 'flags')
     x, y = helpers.unpacked_properties('pos')
 
-    def __init__(self, image, pos=(0, 0), opacity=1):
+    def __init__(self, image, pos=(0, 0), opacity=1, flags=0):
         self.image = image
         self.pos = pos
         self.opacity = opacity
+        self.flags = flags
 
     def draw(self, canvas):
         canvas.draw_image(self.image, self.pos,
-                          opacity=self.opacity)
+                          opacity=self.opacity, flags=self.flags)
+
+    def translated(self, offset):
+        x, y = self.pos
+        dx, dy = offset
+        return DrawImageCommand(self.image, (x + dx, y + dy),
+                                opacity=self.opacity, flags=self.flags)
+
+
+class DrawImageBatchCommand(DrawCommand):
+    """Command to draw several images with the same opacity
+
+    The images are drawn in order, and composed together before the
+    opacity is applied, so the batch looks like a single semi-transparent
+    layer.
+
+    init arguments that become attributes:
+
+        .. attribute:: items
+
+            List of (image, pos, flags) triples; see
+            :class:`DrawImageCommand` for the meaning of the values
+
+        .. attribute:: opacity
+
+            The opacity of the whole batch
+    """
+    __slots__ = ('items', 'opacity')
+
+    def __init__(self, items=(), opacity=1):
+        self.items = list(items)
+        self.opacity = opacity
+
+    def draw(self, canvas):
+        canvas.draw_images(self.items, opacity=self.opacity)
+
+    def translated(self, offset):
+        dx, dy = offset
+        return DrawImageBatchCommand(
+            [(image, (x + dx, y + dy), flags)
+             for image, (x, y), flags in self.items],
+            opacity=self.opacity)
+
+
+def batch_commands(commands):
+    """Combine consecutive DrawImageCommands into DrawImageBatchCommands
+
+    Image commands with the same opacity are combined; other commands are
+    passed through unchanged. The drawing order is kept.
+
+    Since images in a batch are composed before the opacity is applied, this
+    should be used on the commands of a single layer.
+    """
+    batch = None
+    for command in commands:
+        if type(command) is DrawImageCommand:
+            if batch is not None and batch.opacity == command.opacity:
+                batch.items.append(
+                    (command.image, command.pos, command.flags))
+                continue
+            if batch is not None:
+                yield batch
+            batch = DrawImageBatchCommand(
+                [(command.image, command.pos, command.flags)],
+                command.opacity)
+        else:
+            if batch is not None:
+                yield batch
+                batch = None
+            yield command
+    if batch is not None:
+        yield batch
@@ -6,7 +6,6 @@ import base64
 import zlib
 import array
 import gzip
-import struct
 import binascii
 import io
 import functools
@@ -22,39 +21,69 @@ except ImportError:  # pragma: no cover
     from xml.etree import ElementTree as etree
     have_lxml = False
     warnings.warn(ImportWarning('lxml is recommended'))
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from tmxlib.compatibility import array_frombytes, bytes_view
 
-from tmxlib.compatibility import ord_
+
+# Typecode of an array.array item that holds exactly 32 bits
+if array.array('I').itemsize == 4:
+    GID_TYPECODE = 'I'
+elif array.array('L').itemsize == 4:  # pragma: no cover
+    GID_TYPECODE = 'L'
+else:  # pragma: no cover
+    raise ImportError('No 32-bit array.array typecode on this platform')
 
 
 class ReadWriteBase(object):
     """Base class for objects that support loading and saving.
     """
     @classmethod
-    def open(cls, filename, serializer=None, base_path=None, shared=False):
+    def open(cls, filename, serializer=None, base_path=None, shared=False,
+             **options):
         """Load an object of this class from a file
 
-        :arg filename: The file from which to load
+        :arg filename: The file from which to load.
+            This may also be an open file object, in which case it is read
+            incrementally (see :meth:`TMXSerializer.load_stream`).
 
         :arg shared: Objects loaded from a single file with `shared=True` will
             be reused.
             Modifications to this shared object will, naturally, be visible
             from all variables that reference it.
             (External tilesets are loaded as `shared` by default.)
+
+        Other keyword arguments are loading options, passed to the serializer.
+        For maps, these are:
+
+        :arg lazy_layers: If true, tile layer data is only decoded when
+            it is first accessed. Tile layers that are never accessed are
+            saved exactly as they were loaded.
         """
         serializer = serializer_getdefault(serializer)
         return serializer.open(cls, cls._rw_obj_type, filename, base_path,
-                shared)
+                shared, **options)
 
     @classmethod
-    def load(cls, string, serializer=None, base_path=None):
+    def load(cls, string, serializer=None, base_path=None, **options):
         """Load an object of this class from a string.
 
         :arg string:
             String containing the XML description of the object, as it would be
             read from a file.
+
+        Other keyword arguments are loading options; see :meth:`open`.
         """
         serializer = serializer_getdefault(serializer)
-        return serializer.load(cls, cls._rw_obj_type, string, base_path)
+        return serializer.load(cls, cls._rw_obj_type, string, base_path,
+                **options)
 
     def save(self, filename, serializer=None, base_path=None):
         """Save this object to a file
@@ -92,8 +121,17 @@ def load_method(func):
 
 
 class TMXSerializer(object):
-    def __init__(self):
+    """Reads and writes TMX files
+
+    :arg compression_levels: Optional dict mapping a tile layer compression
+        (``'zlib'``, ``'gzip'`` or ``'zstd'``) to the compression level to
+        use when saving. Compressions not in the dict use the default level
+        of the underlying library.
+        Available as the `compression_levels` attribute.
+    """
+    def __init__(self, compression_levels=None):
         import tmxlib
+        self.compression_levels = dict(compression_levels or {})
         self.map_class = tmxlib.Map
         self.tile_layer_class = tmxlib.TileLayer
         self.object_layer_class = tmxlib.ObjectLayer
@@ -119,21 +157,31 @@ class TMXSerializer(object):
         with open(filename, 'rb') as fileobj:
             return fileobj.read()
 
-    def open(self, cls, obj_type, filename, base_path=None, shared=False):
+    def open(self, cls, obj_type, filename, base_path=None, shared=False,
+             **options):
+        if hasattr(filename, 'read'):
+            name = getattr(filename, 'name', None)
+            if not base_path and isinstance(name, six.string_types):
+                base_path = os.path.dirname(os.path.abspath(name))
+            return self.load_stream(cls, obj_type, filename,
+                    base_path=base_path, **options)
         if not base_path:
             base_path = os.path.dirname(os.path.abspath(filename))
         if shared:
             filename = os.path.normpath(os.path.join(base_path, filename))
+            # Objects loaded with different options are not interchangeable
+            key = obj_type, filename, tuple(sorted(options.items()))
             try:
-                return self._shared_objects[obj_type, filename]
+                return self._shared_objects[key]
             except KeyError:
-                self._shared_objects[obj_type, filename] = obj = self.open(
-                        cls, obj_type, filename)
+                self._shared_objects[key] = obj = self.open(
+                        cls, obj_type, filename, **options)
                 return obj
-        return self.load(cls, obj_type, self.load_file(filename),
-                base_path=base_path)
+        with open(filename, 'rb') as fileobj:
+            return self.load_stream(cls, obj_type, fileobj,
+                    base_path=base_path, **options)
 
-    def load(self, cls, obj_type, string, base_path=None):
+    def load(self, cls, obj_type, string, base_path=None, **options):
         if have_lxml:
             tree = etree.XML(string, etree.XMLParser(remove_comments=True))
         else:  # pragma: no cover
@@ -143,11 +191,47 @@ class TMXSerializer(object):
                     if subelem.tag == etree.Comment:
                         elem.remove(subelem)
             strip_comments(tree)
-        return self.from_element(cls, obj_type, tree, base_path=base_path)
+        return self.from_element(cls, obj_type, tree, base_path=base_path,
+                **options)
+
+    def load_stream(self, cls, obj_type, fileobj, base_path=None, **options):
+        """Load an object from a file object, parsing it incrementally
+
+        For maps, each tileset and layer is built as soon as its XML element
+        is parsed, and the element is discarded right after that.
+        The full XML tree is never held in memory.
+        Other objects are loaded as with :meth:`load`.
+        """
+        if obj_type != 'map':
+            return self.load(cls, obj_type, fileobj.read(),
+                    base_path=base_path, **options)
+        if have_lxml:
+            events = etree.iterparse(fileobj, events=('start', 'end'),
+                    remove_comments=True)
+        else:  # pragma: no cover
+            # ElementTree's iterparse skips comments by default
+            events = etree.iterparse(fileobj, events=('start', 'end'))
+        map = root = None
+        depth = 0
+        for event, elem in events:
+            if event == 'start':
+                if root is None:
+                    root = elem
+                    map = self._new_map(cls, root, base_path)
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 1:
+                    self._read_map_element(map, elem, base_path, **options)
+                    root.remove(elem)
+        map.serializer = self
+        map.base_path = base_path
+        return map
 
-    def from_element(self, cls, obj_type, element, base_path=None):
+    def from_element(self, cls, obj_type, element, base_path=None,
+            **options):
         read_func = getattr(self, obj_type + '_from_element')
-        obj = read_func(cls, element, base_path=base_path)
+        obj = read_func(cls, element, base_path=base_path, **options)
         obj.serializer = self
         return obj
 
@@ -172,7 +256,14 @@ class TMXSerializer(object):
         return write_func(obj, base_path=base_path, **kwargs)
 
     @load_method
-    def map_from_element(self, cls, root, base_path):
+    def map_from_element(self, cls, root, base_path, lazy_layers=False):
+        map = self._new_map(cls, root, base_path)
+        for elem in root:
+            self._read_map_element(map, elem, base_path, lazy_layers)
+        return map
+
+    def _new_map(self, cls, root, base_path):
+        """Create an empty map from the attributes of a <map> element"""
         assert root.tag == 'map'
         assert root.attrib.pop('version') == '1.0', 'Bad TMX file version'
 
@@ -193,27 +284,28 @@ class TMXSerializer(object):
         if render_order:
             args['render_order'] = render_order
         assert not root.attrib, 'Unexpected map attributes: %s' % root.attrib
-        map = cls(**args)
-        for elem in root:
-            if elem.tag == 'properties':
-                map.properties.update(self.read_properties(elem))
-            elif elem.tag == 'tileset':
-                tileset = self.tileset_from_element(
-                    self.tileset_class, elem, base_path=base_path)
-                map.tilesets.append(tileset)
-                assert tileset.first_gid(map) == tileset._read_first_gid
-            elif elem.tag == 'layer':
-                map.layers.append(self.tile_layer_from_element(
-                        self.tile_layer_class, elem, map))
-            elif elem.tag == 'objectgroup':
-                map.layers.append(self.object_layer_from_element(
-                        self.object_layer_class, elem, map))
-            elif elem.tag == 'imagelayer':
-                map.layers.append(self.image_layer_from_element(
-                        self.image_layer_class, elem, map, base_path))
-            else:
-                raise ValueError('Unknown tag %s' % elem.tag)
-        return map
+        return cls(**args)
+
+    def _read_map_element(self, map, elem, base_path, lazy_layers=False):
+        """Add the contents of a child of a <map> element to the map"""
+        if elem.tag == 'properties':
+            map.properties.update(self.read_properties(elem))
+        elif elem.tag == 'tileset':
+            tileset = self.tileset_from_element(
+                self.tileset_class, elem, base_path=base_path)
+            map.tilesets.append(tileset)
+            assert tileset.first_gid(map) == tileset._read_first_gid
+        elif elem.tag == 'layer':
+            map.layers.append(self.tile_layer_from_element(
+                    self.tile_layer_class, elem, map, lazy=lazy_layers))
+        elif elem.tag == 'objectgroup':
+            map.layers.append(self.object_layer_from_element(
+                    self.object_layer_class, elem, map))
+        elif elem.tag == 'imagelayer':
+            map.layers.append(self.image_layer_from_element(
+                    self.image_layer_class, elem, map, base_path))
+        else:
+            raise ValueError('Unknown tag %s' % elem.tag)
 
     def map_to_element(self, map, base_path):
         elem = etree.Element('map', attrib=dict(
@@ -416,56 +508,81 @@ class TMXSerializer(object):
         return element
 
     @load_method
-    def tile_layer_from_element(self, cls, elem, map):
-        layer = cls(map, elem.attrib.pop('name'),
-                opacity=float(elem.attrib.pop('opacity', 1)),
-                visible=bool(int(elem.attrib.pop('visible', 1))))
+    def tile_layer_from_element(self, cls, elem, map, lazy=False):
+        name = elem.attrib.pop('name')
+        opacity = float(elem.attrib.pop('opacity', 1))
+        visible = bool(int(elem.attrib.pop('visible', 1)))
         layer_size = (int(elem.attrib.pop('width')),
                 int(elem.attrib.pop('height')))
         assert layer_size == map.size
         assert not elem.attrib, (
             'Unexpected tile layer attributes: %s' % elem.attrib)
-        data_set = False
+        properties = {}
+        encoded_data = gids = None
         for subelem in elem:
             if subelem.tag == 'properties':
-                layer.properties.update(self.read_properties(subelem))
+                properties.update(self.read_properties(subelem))
             elif subelem.tag == 'data':
-                assert data_set is False
-                data = subelem.text.encode('ascii')
-                encoding = subelem.attrib.pop('encoding')
-                if encoding == 'base64':
-                    data = base64.b64decode(data)
-                    layer.encoding = 'base64'
-                else:
+                assert encoded_data is None and gids is None
+                encoding = subelem.attrib.pop('encoding', None)
+                if encoding not in (None, 'base64', 'csv'):
                     raise ValueError('Bad encoding %s' % encoding)
                 compression = subelem.attrib.pop('compression', None)
-                if compression == 'gzip':
-                    filelike = io.BytesIO(data)
-                    gzfile = gzip.GzipFile(fileobj=filelike)
-                    data = gzfile.read()
-                    gzfile.close()
-                    layer.compression = 'gzip'
-                elif compression == 'zlib':
-                    data = zlib.decompress(data)
-                    layer.compression = 'zlib'
-                elif compression:
-                        raise ValueError(
-                                'Bad compression %s' % compression)
+                if compression not in (None, 'gzip', 'zlib', 'zstd'):
+                    raise ValueError('Bad compression %s' % compression)
+                if compression and encoding != 'base64':
+                    raise ValueError('Compression requires base64 encoding')
+                if encoding is None:
+                    # One <tile> element per tile; empty tiles may omit gid
+                    gids = [tile.attrib.get('gid', '0') for tile in subelem]
                 else:
-                    layer.compression = None
-                layer.data = array.array('L', [(
-                            ord_(a) +
-                            (ord_(b) << 8) +
-                            (ord_(c) << 16) +
-                            (ord_(d) << 24)) for
-                        a, b, c, d in
-                        zip(*(data[x::4] for x in range(4)))])
-                data_set = True
+                    encoded_data = subelem.text, encoding, compression
             else:
                 raise ValueError('Unknown tag %s' % subelem.tag)
-        assert data_set
+        if gids is not None:
+            layer = cls(map, name, opacity=opacity, visible=visible)
+            layer.encoding = layer.compression = None
+            layer.data = gids_from_strings(gids, layer.storage)
+        else:
+            assert encoded_data is not None
+            layer = cls(map, name, opacity=opacity, visible=visible,
+                    encoded_data=encoded_data)
+        layer.properties.update(properties)
+        layer.serializer = self
+        if not lazy:
+            # Accessing the data decodes it
+            layer.data
         return layer
 
+    def decode_tile_data(self, text, encoding, compression, storage='array'):
+        """Decode the contents of a tile layer's <data> element
+
+        Returns a container for the given layer storage type; see
+        :class:`~tmxlib.layer.TileLayer`.
+        """
+        if encoding == 'csv':
+            if compression:
+                raise ValueError('Compression requires base64 encoding')
+            return gids_from_strings(text.split(','), storage)
+        data = text.encode('ascii')
+        if encoding == 'base64':
+            data = base64.b64decode(data)
+        else:
+            raise ValueError('Bad encoding %s' % encoding)
+        if compression == 'gzip':
+            filelike = io.BytesIO(data)
+            gzfile = gzip.GzipFile(fileobj=filelike)
+            data = gzfile.read()
+            gzfile.close()
+        elif compression == 'zlib':
+            data = zlib.decompress(data)
+        elif compression == 'zstd':
+            data = _zstd_module().ZstdDecompressor().decompressobj(
+                ).decompress(data)
+        elif compression:
+            raise ValueError('Bad compression %s' % compression)
+        return gids_from_bytes(data, storage)
+
     def layer_to_element(self, layer, base_path):
         if layer.type == 'objects':
             return self.object_layer_to_element(layer)
@@ -489,10 +606,6 @@ class TMXSerializer(object):
 
         self.append_properties(element, layer.properties)
 
-        # XXX: Make this yet faster
-        data = layer.data
-        data = struct.pack('<%sI' % len(data), *data)
-
         compression = getattr(layer, 'compression', 'zlib')
         encoding = getattr(layer, 'encoding', 'base64')
         extra_attrib = {}
@@ -501,33 +614,76 @@ class TMXSerializer(object):
         if encoding:
             extra_attrib['encoding'] = encoding
 
+        data_elem = etree.Element('data', attrib=extra_attrib)
+        encoded_data = getattr(layer, 'encoded_data', None)
+        if encoding is None:
+            if compression:
+                raise ValueError('Compression requires base64 encoding')
+            for value in layer.data.tolist():
+                etree.SubElement(data_elem, 'tile', gid=str(value))
+        elif encoded_data and encoded_data[1:] == (encoding, compression):
+            # Data was never decoded; write it out unchanged
+            data_elem.text = encoded_data[0]
+        else:
+            data_elem.text = self.encode_tile_data(
+                layer.data, encoding, compression,
+                mtime=getattr(layer, 'mtime', None), width=layer.map.width)
+        element.append(data_elem)
+        return element
+
+    def encode_tile_data(self, data, encoding, compression, mtime=None,
+                         width=None):
+        """Encode tile layer data for a <data> element
+
+        This is the inverse of :meth:`decode_tile_data`.
+        `mtime` is the modification time stored in gzip-compressed data.
+        If `width` is given, CSV data is split into lines of that many tiles,
+        as Tiled does.
+        """
+        if encoding == 'csv':
+            if compression:
+                raise ValueError('Compression requires base64 encoding')
+            strings = list(map(str, data.tolist()))
+            if not width:
+                return ','.join(strings)
+            rows = (','.join(strings[start:start + width])
+                    for start in range(0, len(strings), width))
+            return '\n%s\n' % ',\n'.join(rows)
+        data = gids_to_bytes(data)
+        level = self.compression_levels.get(compression)
         if compression == 'gzip':
             bytes_io = io.BytesIO()
             if sys.version_info >= (2, 7):
-                kwargs = dict(mtime=getattr(layer, 'mtime', None))
+                kwargs = dict(mtime=mtime)
             else:  # pragma: no cover
                 kwargs = dict()
+            if level is not None:
+                kwargs['compresslevel'] = level
             gzfile = gzip.GzipFile(fileobj=bytes_io, mode='wb', **kwargs)
             gzfile.write(data)
             gzfile.close()
             data = bytes_io.getvalue()
         elif compression == 'zlib':
-            data = zlib.compress(data)
-            extra_attrib['compression'] = 'zlib'
+            if level is None:
+                data = zlib.compress(data)
+            else:
+                data = zlib.compress(data, level)
+        elif compression == 'zstd':
+            if level is None:
+                compressor = _zstd_module().ZstdCompressor()
+            else:
+                compressor = _zstd_module().ZstdCompressor(level=level)
+            data = compressor.compress(data)
         elif compression:
             raise ValueError('Bad compression: %s', compression)
         if encoding == 'base64':
             data = base64.b64encode(data)
-            extra_attrib['encoding'] = 'base64'
         else:
             raise ValueError('Bad encoding: %s', encoding)
-        data_elem = etree.Element('data', attrib=extra_attrib)
         if six.PY3:  # pragma: no cover
             # etree only deals with (unicode) strings
             data = data.decode('ascii')
-        data_elem.text = data
-        element.append(data_elem)
-        return element
+        return data
 
     @load_method
     def object_layer_from_element(self, cls, elem, map):
@@ -543,6 +699,8 @@ class TMXSerializer(object):
         assert layer_size == map.size
         assert not elem.attrib, (
             'Unexpected object layer attributes: %s' % elem.attrib)
+        columns = layer.columns
+        objects = []
         for subelem in elem:
             if subelem.tag == 'properties':
                 layer.properties.update(self.read_properties(subelem))
@@ -571,25 +729,28 @@ class TMXSerializer(object):
                 assert not subelem.attrib, (
                     'Unexpected object attributes: %s' % subelem.attrib)
                 properties = {}
-                cls = self.rectangle_object_class
+                objtype = 'rectangle'
                 for subsubelem in subelem:
                     if subsubelem.tag == 'properties':
                         properties.update(self.read_properties(subsubelem))
-                    elif subsubelem.tag == 'ellipse':
-                        cls = self.ellipse_object_class
-                    elif subsubelem.tag == 'polygon':
-                        cls = self.polygon_object_class
-                        kwargs['points'] = [[int(x) for x in p.split(',')]
-                            for p in subsubelem.attrib['points'].split()]
-                    elif subsubelem.tag == 'polyline':
-                        cls = self.polyline_object_class
+                    elif subsubelem.tag in ('ellipse', 'polygon', 'polyline'):
+                        objtype = subsubelem.tag
+                    if subsubelem.tag in ('polygon', 'polyline'):
                         kwargs['points'] = [[int(x) for x in p.split(',')]
                             for p in subsubelem.attrib['points'].split()]
+                if columns is not None:
+                    # Fill the columns directly, without creating objects
+                    del kwargs['layer']
+                    columns.add_row(objtype, properties=properties, **kwargs)
+                    continue
+                cls = getattr(self, objtype + '_object_class')
                 obj = cls(**kwargs)
                 obj.properties.update(properties)
-                layer.append(obj)
+                objects.append(obj)
             else:
                 raise ValueError('Unknown tag %s' % subelem.tag)
+        # Add all objects at once: each list modification copies the list
+        layer[len(layer):] = objects
         return layer
 
     def object_layer_to_element(self, layer):
@@ -607,7 +768,12 @@ class TMXSerializer(object):
 
         self.append_properties(element, layer.properties)
 
-        for object in layer:
+        if layer.columns is not None:
+            # ObjectRows have the attributes used below; no objects needed
+            objects = layer.columns.rows()
+        else:
+            objects = layer
+        for object in objects:
             attrib = dict(x=str(object.pixel_x), y=str(object.pixel_y))
             if object.name:
                 attrib['name'] = str(object.name)
@@ -696,6 +862,98 @@ class TMXSerializer(object):
                     )))
             parent.append(element)
 
+
+def gids_from_bytes(data, storage='array'):
+    """Decode a TMX layer data buffer into a container of values
+
+    `data` holds unsigned 32-bit little-endian integers, as found in TMX
+    files after base64 decoding and decompression.
+    The buffer is converted in bulk, without handling individual values in
+    Python code.
+
+    The result is an ``array.array('L')`` by default.
+    See :class:`~tmxlib.layer.TileLayer` for other storage types.
+    """
+    if len(data) % 4:
+        raise ValueError('Layer data size is not a multiple of 4')
+    if storage == 'numpy':
+        np = _numpy_module()
+        return np.frombuffer(data, dtype='<u4').astype(np.uint32)
+    elif storage == 'compact':
+        result = array.array(GID_TYPECODE)
+    elif storage == 'array':
+        result = array.array('L')
+    else:
+        raise ValueError('Bad layer storage: %s' % storage)
+    if result.itemsize == 4:
+        array_frombytes(result, data)
+        if sys.byteorder == 'big':  # pragma: no cover
+            result.byteswap()
+    elif numpy is not None:
+        values = numpy.frombuffer(data, dtype='<u4').astype(result.typecode)
+        array_frombytes(result, values.tobytes())
+    else:
+        values = array.array(GID_TYPECODE)
+        array_frombytes(values, data)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        result = array.array('L', values)
+    return result
+
+
+def _numpy_module():
+    if numpy is None:
+        raise ImportError('NumPy is needed for numpy layer storage')
+    return numpy
+
+
+def _zstd_module():
+    if zstandard is None:
+        raise ImportError('The zstandard module is needed for zstd '
+                          'compression')
+    return zstandard
+
+
+def gids_from_strings(values, storage='array'):
+    """Convert a sequence of decimal strings into a container of values
+
+    Used for the CSV and XML encodings of TMX layer data.
+    Surrounding whitespace is ignored.
+    The strings are converted in bulk, without per-value Python code.
+    See :func:`gids_from_bytes` for the `storage` argument.
+    """
+    if storage == 'numpy':
+        np = _numpy_module()
+        return np.fromiter(map(int, values), dtype=np.uint32,
+                           count=len(values))
+    elif storage == 'compact':
+        return array.array(GID_TYPECODE, map(int, values))
+    elif storage == 'array':
+        return array.array('L', map(int, values))
+    else:
+        raise ValueError('Bad layer storage: %s' % storage)
+
+
+def gids_to_bytes(data):
+    """Encode layer values as unsigned 32-bit little-endian integers
+
+    This is the inverse of :func:`gids_from_bytes`.
+    The result is a bytes-like object. If `data` already has the right
+    memory layout, it is a view of `data` rather than a copy.
+    """
+    if isinstance(data, array.array):
+        if data.itemsize == 4 and sys.byteorder == 'little':
+            return bytes_view(data)
+        elif numpy is not None:
+            data = numpy.frombuffer(data, dtype=data.typecode)
+    if numpy is not None and isinstance(data, numpy.ndarray):
+        return bytes_view(numpy.ascontiguousarray(data, dtype='<u4'))
+    values = array.array(GID_TYPECODE, data)
+    if sys.byteorder == 'big':  # pragma: no cover
+        values.byteswap()
+    return bytes_view(values)
+
+
 def from_hexcolor(string):
     if string.startswith('#'):
         string = string[1:]
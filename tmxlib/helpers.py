@@ -5,6 +5,7 @@ from __future__ import division
 import functools
 import collections
 import contextlib
+import weakref
 
 import six
 from six.moves import zip_longest
@@ -87,7 +88,36 @@ def unpacked_properties(full_prop_name, count=2):
     return [get_prop(i) for i in range(count)]
 
 
+class SlotsPickleMixin(object):
+    """Makes classes that use __slots__ picklable with any protocol
+
+    Without this, pickle protocols 0 and 1 (the default on Python 2) refuse
+    objects without a __dict__.
+    """
+    __slots__ = ()
+
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', ()))
+        for cls in type(self).__mro__:
+            slots = cls.__dict__.get('__slots__', ())
+            if isinstance(slots, six.string_types):
+                slots = slots,
+            for name in slots:
+                if name in ('__dict__', '__weakref__'):
+                    continue
+                try:
+                    state[name] = object.__getattribute__(self, name)
+                except AttributeError:
+                    pass
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+
 class SizeMixin(object):
+    __slots__ = ()
     width, height = unpacked_properties('size')
 
     def _wrap_coords(self, x, y):
@@ -106,6 +136,7 @@ class SizeMixin(object):
 class LayerElementMixin(object):
     """Provides a `map` attribute extracted from the object's `layer`.
     """
+    __slots__ = ()
 
     @property
     def map(self):
@@ -116,6 +147,7 @@ class LayerElementMixin(object):
 class TileMixin(SizeMixin, LayerElementMixin):
     """Provides `size` based on `pixel_size` and the map
     """
+    __slots__ = ()
     tile_width, tile_height = unpacked_properties('tile_size')
     pixel_width, pixel_height = unpacked_properties('pixel_size')
     pixel_x, pixel_y = unpacked_properties('pixel_pos')
@@ -132,6 +164,76 @@ class TileMixin(SizeMixin, LayerElementMixin):
         self.pixel_size = value[0] * px_parent[0], value[1] * px_parent[1]
 
 
+class ContainerRegistry(object):
+    """Remembers which containers keep indexes that depend on an element
+
+    When the element changes in a way that makes such indexes stale,
+    :meth:`pop` gives the containers whose index should be discarded.
+
+    Both elements and containers are referenced weakly.
+    """
+    def __init__(self):
+        self._containers = weakref.WeakKeyDictionary()
+
+    def add(self, element, container):
+        """Note that `container` has an index that depends on `element`"""
+        try:
+            containers = self._containers[element]
+        except KeyError:
+            containers = self._containers[element] = {}
+        containers[id(container)] = weakref.ref(container)
+
+    def pop(self, element):
+        """Return the live containers registered for `element`, and forget them
+        """
+        refs = self._containers.pop(element, {})
+        containers = [ref() for ref in refs.values()]
+        return [c for c in containers if c is not None]
+
+
+# NamedElementLists whose name index includes an element
+_name_index_lists = ContainerRegistry()
+
+
+class NameProperty(object):
+    """Descriptor for the ``name`` of elements of a NamedElementList
+
+    The name is stored in the ``_name`` attribute.
+    Renaming an element discards the name indexes of the lists that contain
+    it (see :meth:`watch` and :meth:`renamed`).
+    """
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return self.get(instance)
+
+    def __set__(self, instance, value):
+        try:
+            old = self.get(instance)
+        except AttributeError:
+            # Setting the name for the first time, not a rename
+            pass
+        else:
+            if old != value:
+                self.renamed(instance)
+        self.set(instance, value)
+
+    def watch(self, instance, lst):
+        """Make `lst` discard its name index when `instance` is renamed"""
+        _name_index_lists.add(instance, lst)
+
+    def renamed(self, instance):
+        """Discard the name indexes that include `instance`"""
+        for lst in _name_index_lists.pop(instance):
+            lst._name_index = None
+
+    def get(self, instance):
+        return instance._name
+
+    def set(self, instance, value):
+        instance._name = value
+
+
 class NamedElementList(collections.MutableSequence):
     """A list that supports indexing by element name, as a convenience, etc
 
@@ -139,9 +241,17 @@ class NamedElementList(collections.MutableSequence):
     ``element.name == some_name``.
     The dict-like ``get`` method is provided.
 
+    Lookups by name use an index of the names, which is built on the first
+    such lookup. Appending items and replacing single items update the index;
+    other modifications discard it, and it is rebuilt when next needed.
+    Elements whose ``name`` is a :class:`NameProperty` can be renamed at any
+    time; other elements must not be renamed while they are in the list.
+
     Additionally, NamedElementList subclasses can use several hooks to control
     how their elements are stored or what is allowed as elements.
     """
+    _name_index = None
+
     def __init__(self, lst=None):
         """Initialize this list from an iterable"""
         if lst is None:
@@ -149,16 +259,83 @@ class NamedElementList(collections.MutableSequence):
         else:
             self.list = [self.stored_value(item) for item in lst]
 
+    def __getstate__(self):
+        # Elements don't know about unpickled lists; rebuild the index later
+        state = dict(self.__dict__)
+        state.pop('_name_index', None)
+        return state
+
+    def _item_name(self, item):
+        """Return the name of a stored item, and watch it for renames"""
+        element = self.retrieved_value(item)
+        descriptor = getattr(type(element), 'name', None)
+        if isinstance(descriptor, NameProperty):
+            descriptor.watch(element, self)
+        return element.name
+
+    def _get_name_index(self):
+        """Return the name index, building it if necessary
+
+        The index is a dict mapping each name to the index of the first
+        element with that name.
+        """
+        name_index = self._name_index
+        if name_index is None:
+            name_index = {}
+            for i, name in enumerate(self._all_names()):
+                name_index.setdefault(name, i)
+            self._name_index = name_index
+        return name_index
+
+    def _all_names(self):
+        """Return the names of all stored items, in order
+
+        The items are watched for renames.
+        """
+        return [self._item_name(item) for item in self.list]
+
+    def _update_name_index(self, index, old_item, new_item):
+        """Update the name index after a single-item modification
+
+        `index` is the (non-negative) position that changed.
+        For insertions `old_item` is None, for deletions `new_item` is None.
+        Modifications that can't be handled cheaply discard the index.
+        """
+        name_index = self._name_index
+        if name_index is None:
+            return
+        length = len(self.list)
+        if old_item is not None and new_item is not None:
+            # Replacement
+            old_name = self._item_name(old_item)
+            name = self._item_name(new_item)
+            if old_name == name:
+                return
+            if name_index.get(old_name) == index:
+                self._name_index = None
+                return
+            if name_index.get(name, length) > index:
+                name_index[name] = index
+        elif new_item is not None and index == length - 1:
+            # Append
+            name_index.setdefault(self._item_name(new_item), index)
+        elif old_item is not None and index == length:
+            # Removal of the last item
+            name = self._item_name(old_item)
+            if name_index.get(name) == index:
+                del name_index[name]
+        else:
+            self._name_index = None
+
     def _get_index(self, index_or_name):
         """Get the list index corresponding to a __getattr__ (etc.) argument
 
         Raises KeyError if a name is not found.
         """
         if isinstance(index_or_name, six.string_types):
-            for i, element in enumerate(self):
-                if self.retrieved_value(element).name == index_or_name:
-                    return i
-            else:
+            try:
+                return self._get_name_index()[index_or_name]
+            except KeyError:
                 raise KeyError(index_or_name)
         else:
             return index_or_name
@@ -177,10 +354,7 @@ class NamedElementList(collections.MutableSequence):
         NamedElementLists can be queried either by name or by item.
         """
         if isinstance(item_or_name, six.string_types):
-            for i in self.list:
-                if self.retrieved_value(i).name == item_or_name:
-                    return True
-            return False
+            return item_or_name in self._get_name_index()
         else:
             return self.stored_value(item_or_name) in self.list
 
@@ -191,9 +365,15 @@ class NamedElementList(collections.MutableSequence):
             if isinstance(index_or_name, slice):
                 self.list[index_or_name] = (self.stored_value(i)
                         for i in value)
+                self._name_index = None
             else:
                 stored = self.stored_value(value)
-                self.list[self._get_index(index_or_name)] = stored
+                index = self._get_index(index_or_name)
+                old = self.list[index]
+                self.list[index] = stored
+                if index < 0:
+                    index += len(self.list)
+                self._update_name_index(index, old, stored)
 
     def __getitem__(self, index_or_name):
         """Same as list's, except non-slice indices may be names.
@@ -219,15 +399,21 @@ class NamedElementList(collections.MutableSequence):
         with self.modification_context():
             if isinstance(index_or_name, slice):
                 del self.list[index_or_name]
+                self._name_index = None
             else:
-                del self.list[self._get_index(index_or_name)]
+                index = self._get_index(index_or_name)
+                old = self.list[index]
+                del self.list[index]
+                if index < 0:
+                    index += len(self.list) + 1
+                self._update_name_index(index, old, None)
 
     def insert(self, index_or_name, value):
         """Same as list.insert, except indices may be names instead of ints.
         """
         index = self._get_index(index_or_name)
         with self.modification_context():
-            self.list.insert(index, self.stored_value(value))
+            self._insert(index, self.stored_value(value))
 
     def insert_after(self, index_or_name, value):
         """Insert the new value after the position specified by index_or_name
@@ -237,7 +423,14 @@ class NamedElementList(collections.MutableSequence):
         """
         with self.modification_context():
             index = self._get_index(index_or_name) + 1
-            self.list.insert(index, self.stored_value(value))
+            self._insert(index, self.stored_value(value))
+
+    def _insert(self, index, stored):
+        """Insert an already stored value, and update the name index"""
+        # Find the resulting position, like list.insert does
+        index = slice(index, None).indices(len(self.list))[0]
+        self.list.insert(index, stored)
+        self._update_name_index(index, None, stored)
 
     def move(self, index_or_name, amount):
         """Move an item by the specified number of indexes
@@ -293,4 +486,5 @@ class NamedElementList(collections.MutableSequence):
             yield
         except:
             self.list = previous
+            self._name_index = None
             raise
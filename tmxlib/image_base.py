@@ -29,6 +29,7 @@ class ImageBase(helpers.SizeMixin):
     Pixels are represented as (r, g, b, a) float tuples, with components in the
     range of 0 to 1.
     """
+    __slots__ = ()
     x, y = helpers.unpacked_properties('top_left')
 
     def __getitem__(self, pos):
@@ -170,7 +171,7 @@ class Image(ImageBase, fileio.ReadWriteBase):
         raise TypeError('Image data not available')
 
 
-class ImageRegion(ImageBase):
+class ImageRegion(ImageBase, helpers.SlotsPickleMixin):
     """A rectangular region of a larger image
 
     init arguments that become attributes:
@@ -189,6 +190,8 @@ class ImageRegion(ImageBase):
             The size of the region.
             Will also available as ``width`` and ``height`` attributes.
     """
+    __slots__ = ('top_left', 'size', 'parent')
+
     def __init__(self, parent, top_left, size):
         self.top_left = top_left
         self.size = size
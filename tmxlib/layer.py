@@ -2,9 +2,21 @@
 
 from __future__ import division
 
+import math
+import heapq
 import array
+import functools
+import contextlib
+import itertools
+import operator
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
 
 from tmxlib import helpers, tileset, tile, mapobject, image, fileio, draw
+from tmxlib.compatibility import array_frombytes
 
 
 class LayerList(helpers.NamedElementList):
@@ -66,6 +78,8 @@ class Layer(object):
     A Layer is false in a boolean context iff it is empty, that is, if all
     tiles of a tile layer are false, or if an object layer contains no objects.
     """
+    name = helpers.NameProperty()
+
     def __init__(self, map, name, visible=True, opacity=1):
         super(Layer, self).__init__()
         self.map = map
@@ -138,30 +152,130 @@ class TileLayer(Layer):
             Optional list (or array) containing the values of tiles in the
             layer, as one long list in row-major order.
             See :class:`TileLikeObject.value` for what the numbers will mean.
+
+            The values are copied into a container given by `storage`.
+            Assigning to the attribute converts the new value only if it is
+            not of the right type already.
+
+        .. attribute:: encoded_data
+
+            Optional ``(text, encoding, compression)`` triple holding the
+            contents of a TMX ``<data>`` element, as an alternative to `data`.
+            The text is only decoded when `data` is first accessed; until
+            then, no memory is allocated for the tile values and the layer is
+            saved with the original text (if `encoding` and `compression` are
+            left unchanged).
+            Once the data is decoded, this attribute is set to None.
+
+            Layers of maps loaded with ``lazy_layers=True`` use this.
+
+        .. attribute:: encoding
+
+            How the data is written to TMX files: ``'base64'`` (the default),
+            ``'csv'``, or None for one XML element per tile.
+            Maps are loaded with the encoding used in the file.
+
+        .. attribute:: compression
+
+            Compression of base64-encoded data: ``'zlib'`` (the default),
+            ``'gzip'``, ``'zstd'``, or None.
+            Other encodings cannot be compressed.
+            Zstandard compression requires the ``zstandard`` module.
+            The compression level can be set with the serializer's
+            `compression_levels`.
+
+        .. attribute:: storage
+
+            The kind of container used for `data`:
+
+            * ``'array'``: an ``array.array`` of type ``'L'`` (the default).
+              Note that on some platforms (e.g. 64-bit Linux), this uses
+              8 bytes per tile.
+            * ``'compact'``: an ``array.array`` with 4 bytes per tile, which
+              is enough for any TMX value.
+            * ``'numpy'``: a one-dimensional NumPy array of ``uint32``.
+              Requires NumPy to be installed.
+
+            If not given, the class attribute ``default_storage`` is used.
+            Set ``tmxlib.TileLayer.default_storage`` to change the storage
+            of all layers created afterwards, including those of loaded maps.
     """
-    def __init__(self, map, name, visible=True, opacity=1, data=None):
+    default_storage = 'array'
+
+    def __init__(self, map, name, visible=True, opacity=1, data=None,
+                 storage=None, encoded_data=None):
         super(TileLayer, self).__init__(map=map, name=name,
                 visible=visible, opacity=opacity)
+        self.storage = storage or self.default_storage
+        self.encoding = 'base64'
+        self.compression = 'zlib'
+        self.type = 'tiles'
         data_size = map.width * map.height
-        if data is None:
-            self.data = array.array('L', [0] * data_size)
+        if encoded_data is not None:
+            if data is not None:
+                raise ValueError('Cannot specify both data and encoded_data')
+            self._data = None
+            self.encoded_data = encoded_data
+            self.encoding, self.compression = encoded_data[1:]
+        elif data is None:
+            self.data = _new_data(self.storage, data_size)
         else:
             if len(data) != data_size:
                 raise ValueError('Invalid layer data size')
-            self.data = array.array('L', data)
-        self.encoding = 'base64'
-        self.compression = 'zlib'
-        self.type = 'tiles'
+            self.data = _new_data(self.storage, data_size, data)
+
+    @property
+    def data(self):
+        if self._data is None:
+            text, encoding, compression = self.encoded_data
+            serializer = fileio.serializer_getdefault(object=self)
+            data = serializer.decode_tile_data(
+                text, encoding, compression, self.storage)
+            if len(data) != self.map.width * self.map.height:
+                raise ValueError('Invalid layer data size')
+            self._data = data
+            self.encoded_data = None
+        return self._data
+    @data.setter
+    def data(self, new_data):
+        new_data = _convert_data(self.storage, new_data)
+        if len(new_data) != self.map.width * self.map.height:
+            raise ValueError('Invalid layer data size')
+        self._data = new_data
+        self.encoded_data = None
+
+    @property
+    def nbytes(self):
+        """Size of the layer's tile data in memory, in bytes
+        """
+        return len(self.data) * self.data.itemsize
+
+    def as_array(self):
+        """Return the layer's data as a 2D NumPy array, indexed by [y, x]
+
+        The result is a view, not a copy: changes to it are reflected in the
+        layer. Note that no checks are done on values written to it.
+
+        Requires NumPy to be installed.
+        """
+        if numpy is None:  # pragma: no cover
+            raise ImportError('NumPy is needed for TileLayer.as_array')
+        if isinstance(self.data, numpy.ndarray):
+            values = self.data
+        else:
+            values = numpy.frombuffer(self.data, dtype=self.data.typecode)
+        return values.reshape(self.map.height, self.map.width)
 
     def _data_index(self, pos):
         """Get an index for the data array from (x, y) coordinates
         """
         x, y = pos
+        width, height = self.map.size
         if x < 0:
-            x += self.map.width
+            x += width
         if y < 0:
-            y += self.map.height
-        return x + y * self.map.width
+            y += height
+        return x + y * width
 
     def __setitem__(self, pos, value):
         """Set the tile at the given position
@@ -172,16 +286,116 @@ class TileLayer(Layer):
 
         Supports negative indices by wrapping in the obvious way.
         """
+        self.data[self._data_index(pos)] = self._checked_value(value)
+
+    def _checked_value(self, value):
+        """Return the raw value to store for a value given to __setitem__
+        """
         if isinstance(value, tileset.TilesetTile):
             try:
-                value = value.gid(self.map)
+                return value.gid(self.map)
             except helpers.TilesetNotInMapError:
                 # Add the tileset
                 self.map.tilesets.append(value.tileset)
-                value = value.gid(self.map)
-        elif value < 0 or (value & 0x0FFF) >= self.map.end_gid:
-            raise ValueError('GID not in map!')
-        self.data[self._data_index(pos)] = int(value)
+                return value.gid(self.map)
+        self._check_values([value])
+        return int(value)
+
+    def _check_values(self, values):
+        """Raise ValueError if any of the raw values is not valid in the map
+        """
+        end_gid = self.map.end_gid
+        for value in values:
+            if (value < 0 or value > 0xFFFFFFFF or
+                    (value & _GID_MASK) >= end_gid):
+                raise ValueError('GID not in map!')
+
+    def _check_region(self, x, y, width, height):
+        if (x < 0 or y < 0 or width < 0 or height < 0 or
+                x + width > self.map.width or y + height > self.map.height):
+            raise IndexError('Region out of layer bounds')
+
+    def get_region(self, x, y, width, height):
+        """Return the values in a rectangular region of the layer
+
+        The result is a list of rows; each row is a copy of part of `data`
+        (in the layer's `storage`).
+
+        Unlike with item access, negative coordinates are not allowed.
+        """
+        self._check_region(x, y, width, height)
+        data = self.data
+        map_width = self.map.width
+        rows = []
+        for row_y in range(y, y + height):
+            start = x + row_y * map_width
+            row = data[start:start + width]
+            if numpy is not None and isinstance(row, numpy.ndarray):
+                row = row.copy()
+            rows.append(row)
+        return rows
+
+    def set_region(self, x, y, block):
+        """Set the values in a rectangular region of the layer
+
+        `block` is a sequence of equally long rows of raw values, such as
+        the result of :meth:`get_region`, or a 2D NumPy array.
+        Its top left corner is placed at (`x`, `y`).
+
+        The values are checked all at once; if any is not valid in the map,
+        ValueError is raised and the layer is not changed.
+        """
+        rows = list(block)
+        if not rows:
+            return
+        width = len(rows[0])
+        if any(len(row) != width for row in rows):
+            raise ValueError('Rows of a region must have the same length')
+        self._check_region(x, y, width, len(rows))
+        # Check before conversion, which could fail or wrap around for values
+        # that don't fit in the storage
+        values = set()
+        for row in rows:
+            if hasattr(row, 'tolist'):
+                row = row.tolist()
+            values.update(row)
+        self._check_values(values)
+        rows = [_convert_data(self.storage, row) for row in rows]
+        data = self.data
+        map_width = self.map.width
+        for row_y, row in enumerate(rows, y):
+            start = x + row_y * map_width
+            data[start:start + width] = row
+
+    def fill(self, rect, value):
+        """Set all tiles in a rectangular region to the same value
+
+        `rect` is an ``(x, y, width, height)`` tuple.
+        As with item assignment, `value` can be a raw value or a TilesetTile.
+        """
+        x, y, width, height = rect
+        self._check_region(x, y, width, height)
+        row = _convert_data(self.storage, [self._checked_value(value)] * width)
+        data = self.data
+        map_width = self.map.width
+        for row_y in range(y, y + height):
+            start = x + row_y * map_width
+            data[start:start + width] = row
+
+    def copy_region(self, src_layer, src_rect, dst_pos):
+        """Copy a rectangular region from a tile layer into this one
+
+        `src_rect` is an ``(x, y, width, height)`` tuple giving the region of
+        `src_layer` to copy; `dst_pos` is the (x, y) position in this layer
+        where its top left corner is placed.
+        `src_layer` may be this layer; the regions may overlap.
+
+        Raw values are copied, so if `src_layer` is in another map, its
+        tilesets should match this map's.
+        """
+        x, y, width, height = src_rect
+        self.set_region(dst_pos[0], dst_pos[1],
+                        src_layer.get_region(x, y, width, height))
 
     def __getitem__(self, pos):
         """Get a MapTile representing the tile at the given position.
@@ -190,6 +404,14 @@ class TileLayer(Layer):
         """
         return tile.MapTile(self, pos)
 
+    def cursor(self, pos=(0, 0)):
+        """Get a TileCursor at the given position
+
+        The cursor is a MapTile that can be moved with its
+        :meth:`~tmxlib.tile.TileCursor.move_to` method, or by setting `pos`.
+        """
+        return tile.TileCursor(self, pos)
+
     def all_tiles(self):
         """Yield all tiles in this layer, including empty ones.
         """
@@ -197,12 +419,55 @@ class TileLayer(Layer):
             for x in range(self.map.width):
                 yield self[x, y]
 
+    def all_values(self):
+        """Yield ``(x, y, value)`` for all tiles in this layer, in row-major
+        order
+
+        Unlike :meth:`all_tiles`, this reads the data directly, without
+        creating MapTile objects.
+        """
+        width = self.map.width
+        data = self.data
+        for y in range(self.map.height):
+            row = data[y * width:(y + 1) * width].tolist()
+            for x, value in enumerate(row):
+                yield x, y, value
+
+    def all_gids(self):
+        """Yield ``(x, y, gid, flags)`` for all tiles in this layer
+
+        `flags` are the flag bits of the value (see :class:`MapTile`).
+        As with :meth:`all_values`, no MapTile objects are created.
+        """
+        for x, y, value in self.all_values():
+            yield x, y, value & _GID_MASK, value & ~_GID_MASK
+
+    def nonzero_positions(self):
+        """Yield ``(x, y)`` positions of all non-empty tiles, in row-major
+        order
+
+        Empty tiles are skipped in bulk, not one by one in Python code.
+        """
+        if numpy is not None:
+            ys, xs = numpy.nonzero(self._gid_array())
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                yield x, y
+        else:
+            width = self.map.width
+            data = self.data
+            mask_gid = functools.partial(operator.and_, _GID_MASK)
+            for y in range(self.map.height):
+                row = data[y * width:(y + 1) * width]
+                for x in itertools.compress(itertools.count(),
+                                            map(mask_gid, row)):
+                    yield x, y
+
     def value_at(self, pos):
         """Return the value at the given position
 
         See :class:`MapTile` for an explanation of the value.
         """
-        return self.data[self._data_index(pos)]
+        return int(self.data[self._data_index(pos)])
 
     def set_value_at(self, pos, new):
         """Sets the raw value at the given position
@@ -212,14 +477,100 @@ class TileLayer(Layer):
         self.data[self._data_index(pos)] = new
 
     def __nonzero__(self):
-        return any(self.all_tiles())
+        """True if the layer has any non-empty tiles
+        """
+        if numpy is not None:
+            return bool(self._gid_array().any())
+        return any(value & _GID_MASK for value in set(self.data))
     __bool__ = __nonzero__
 
+    def count_nonempty(self):
+        """Return the number of non-empty tiles in the layer
+        """
+        if numpy is not None:
+            return int(numpy.count_nonzero(self._gid_array()))
+        data = self.data
+        return len(data) - sum(data.count(value) for value in set(data)
+                               if not value & _GID_MASK)
+
+    def content_bbox(self):
+        """Return the smallest rectangle that contains all non-empty tiles
+
+        The result is an ``(x, y, width, height)`` tuple, in tiles.
+        If the layer is empty, returns None.
+        """
+        width, height = self.map.size
+        if numpy is not None:
+            nonempty = self._gid_array() != 0
+            rows = numpy.flatnonzero(nonempty.any(axis=1)).tolist()
+            if not rows:
+                return None
+            columns = numpy.flatnonzero(nonempty.any(axis=0)).tolist()
+        else:
+            data = self.data
+            def has_content(values):
+                return any(value & _GID_MASK for value in set(values))
+            rows = [y for y in range(height)
+                    if has_content(data[y * width:(y + 1) * width])]
+            if not rows:
+                return None
+            columns = [x for x in range(width)
+                       if has_content(data[x::width])]
+        return (columns[0], rows[0],
+                columns[-1] - columns[0] + 1, rows[-1] - rows[0] + 1)
+
+    def _gid_array(self):
+        """Return the GIDs of the layer's tiles (without flags) as a 2D
+        NumPy array
+        """
+        return self.as_array() & _GID_MASK
+
+    def _gids_out_of_range(self, end_gid):
+        """Return ``(x, y, gid)`` for each tile whose GID is >= end_gid
+
+        The common case of no such tiles is checked with a single scan.
+        """
+        if numpy is not None:
+            gids = self._gid_array()
+            if not gids.size or gids.max() < end_gid:
+                return []
+            ys, xs = numpy.nonzero(gids >= end_gid)
+            return [(x, y, int(gids[y, x]))
+                    for x, y in zip(xs.tolist(), ys.tolist())]
+        if all(value & _GID_MASK < end_gid
+               for value in self._distinct_values()):
+            return []
+        return [(x, y, gid) for x, y, gid, flags in self.all_gids()
+                if gid >= end_gid]
+
+    def _distinct_values(self):
+        """Return the set of distinct values in the layer
+        """
+        if numpy is not None and isinstance(self.data, numpy.ndarray):
+            return set(numpy.unique(self.data).tolist())
+        return set(self.data)
+
+    def _translate_values(self, mapping):
+        """Replace each value in the layer by ``mapping[value]``, in bulk
+
+        `mapping` must contain all values found in the layer.
+        The data container is modified in place.
+        """
+        data = self.data
+        if numpy is not None and isinstance(data, numpy.ndarray):
+            values, inverse = numpy.unique(data, return_inverse=True)
+            new_values = numpy.array([mapping[v] for v in values.tolist()],
+                                     dtype=data.dtype)
+            data[...] = new_values[inverse]
+        else:
+            data[:] = array.array(data.typecode,
+                                  map(mapping.__getitem__, data))
+
     def to_dict(self):
         """Export to a dict compatible with Tiled's JSON plugin"""
         d = super(TileLayer, self).to_dict()
         d.update(dict(
-                data=list(self.data),
+                data=self.data.tolist(),
                 type='tilelayer',
             ))
         return d
@@ -242,14 +593,50 @@ class TileLayer(Layer):
         self.properties.update(dct.pop('properties', {}))
         return self
 
-    def generate_draw_commands(self):
-        for tile in self.all_tiles():
-            if tile:
-                yield draw.DrawImageCommand(
-                    image=tile.image,
-                    pos=(tile.pixel_x, tile.pixel_y - tile.pixel_height),
-                    opacity=self.opacity,
-                )
+    def generate_draw_commands(self, rect=None):
+        """Yield commands to draw the layer's tiles
+
+        If `rect`, an ``(x, y, width, height)`` tuple in pixels, is given,
+        only the tiles that can overlap it are visited.
+        """
+        if rect is None:
+            x, y = 0, 0
+            width, height = self.map.size
+        else:
+            x, y, width, height = self._tile_range(rect)
+            if width <= 0 or height <= 0:
+                return
+        cursor = self.cursor()
+        for row_y, row in enumerate(self.get_region(x, y, width, height), y):
+            for row_x, value in enumerate(row.tolist(), x):
+                if value & _GID_MASK:
+                    cursor.move_to(row_x, row_y)
+                    yield draw.DrawImageCommand(
+                        image=cursor.image,
+                        pos=(cursor.pixel_x,
+                             cursor.pixel_y - cursor.pixel_height),
+                        opacity=self.opacity,
+                        flags=cursor.flags,
+                    )
+
+    def _tile_range(self, rect):
+        """Return the (x, y, width, height) range of tiles to draw in a rect
+
+        `rect` is in pixels.
+        Tiles are drawn from the bottom left corner of their cell, and can be
+        larger than the map's tiles, so the range takes the size of the
+        largest tile into account.
+        """
+        left, top, width, height = rect
+        tile_width, tile_height = self.map.tile_size
+        extent = _max_tile_extent(self.map.tilesets)
+        start_x = max(0, int((left - extent) // tile_width) + 1)
+        start_y = max(0, int(top // tile_height))
+        end_x = min(self.map.width,
+                    int(-(-(left + width) // tile_width)))
+        end_y = min(self.map.height,
+                    int(-(-(top + height + extent) // tile_height)) - 1)
+        return start_x, start_y, end_x - start_x, end_y - start_y
 
     def _repr_png_(self):
         from tmxlib.canvas import Canvas
@@ -258,6 +645,73 @@ class TileLayer(Layer):
         return canvas._repr_png_()
 
 
+def _max_tile_extent(tilesets):
+    """Return the largest width or height of a tile in the given tilesets
+    """
+    extent = 0
+    for tileset in tilesets:
+        extent = max([extent] + list(tileset.tile_size))
+        for image in getattr(tileset, 'images', ()):
+            if image is not None:
+                extent = max([extent] + list(image.size))
+    return extent
+
+
+# array.array typecodes for array-based layer storage types
+_array_typecodes = {'array': 'L', 'compact': fileio.GID_TYPECODE}
+
+
+_GID_MASK = tile.TileLikeObject.gid.value
+
+
+def _new_data(storage, size, values=None):
+    """Return a new container for tile layer data
+
+    If values are not given, the container is filled with `size` zeros.
+    """
+    if storage in _array_typecodes:
+        typecode = _array_typecodes[storage]
+        if values is None:
+            return array.array(typecode, [0]) * size
+        elif numpy is not None and isinstance(values, numpy.ndarray):
+            result = array.array(typecode)
+            array_frombytes(result, values.astype(typecode).tobytes())
+            return result
+        else:
+            return array.array(typecode, values)
+    elif storage == 'numpy':
+        if numpy is None:
+            raise ImportError('NumPy is needed for numpy layer storage')
+        if values is None:
+            return numpy.zeros(size, dtype=numpy.uint32)
+        else:
+            return numpy.array(values, dtype=numpy.uint32)
+    else:
+        raise ValueError('Bad layer storage: %s' % storage)
+
+
+def _convert_data(storage, values):
+    """Return `values` in the container for the given storage
+
+    `values` is returned unchanged if it already is in the right container.
+    Multi-dimensional NumPy arrays (such as from TileLayer.as_array) are
+    flattened.
+    """
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        values = values.reshape(-1)
+    if storage in _array_typecodes:
+        if (isinstance(values, array.array) and
+                values.typecode == _array_typecodes[storage]):
+            return values
+    elif storage == 'numpy' and numpy is not None:
+        if (isinstance(values, numpy.ndarray) and
+                values.dtype == numpy.uint32):
+            return values
+        if isinstance(values, array.array):
+            values = numpy.frombuffer(values, dtype=values.typecode)
+    return _new_data(storage, len(values), values)
+
+
 class ImageLayer(Layer):
     """An image layer
 
@@ -290,7 +744,12 @@ class ImageLayer(Layer):
             ))
         return d
 
-    def generate_draw_commands(self):
+    def generate_draw_commands(self, rect=None):
+        """Yield a command to draw the layer's image
+
+        `rect` is accepted for compatibility with other layers; the image
+        is drawn regardless.
+        """
         yield draw.DrawImageCommand(
             image=self.image,
             pos=(0, 0),
@@ -334,12 +793,188 @@ class ObjectLayer(Layer, helpers.NamedElementList):
 
             The intended color of objects in this layer, as a triple of
             floats (0..1)
+
+        .. attribute:: storage
+
+            How the objects are stored:
+
+            * ``'objects'``: as a list of objects (the default).
+            * ``'columns'``: in a :class:`~tmxlib.mapobject.ObjectColumns`,
+              which stores object attributes in arrays and only creates
+              objects when they are accessed. This uses much less memory
+              for layers with many objects.
+              Note that objects put in such a layer are copied.
+
+            If not given, the class attribute ``default_storage`` is used.
+            Set ``tmxlib.ObjectLayer.default_storage`` to change the storage
+            of all layers created afterwards, including those of loaded maps.
+
+    Other attributes:
+
+        .. attribute:: columns
+
+            The :class:`~tmxlib.mapobject.ObjectColumns` of a layer with
+            ``'columns'`` storage, None for other layers.
+
+    Objects can be looked up by position with :meth:`objects_in_rect`,
+    :meth:`objects_at` and :meth:`nearest`.
+    The first lookup builds a spatial index of the layer's objects, which is
+    then kept up to date as objects are added, removed, moved or resized.
+    With ``'columns'`` storage, the index holds row numbers, so objects are
+    only created for the rows a lookup returns.
     """
-    def __init__(self, map, name, visible=True, opacity=1, color=None):
+    default_storage = 'objects'
+
+    def __init__(self, map, name, visible=True, opacity=1, color=None,
+                 storage=None):
         super(ObjectLayer, self).__init__(map=map, name=name,
                 visible=visible, opacity=opacity)
         self.type = 'objects'
         self.color = color
+        self.storage = storage or self.default_storage
+        self._object_index = None
+        self._object_positions = None
+        if self.storage == 'columns':
+            self.list = mapobject.ObjectColumns(self)
+        elif self.storage != 'objects':
+            raise ValueError('Bad object layer storage: %s' % self.storage)
+
+    def __getstate__(self):
+        # Positions are keyed by object ids, which don't survive pickling;
+        # the spatial index is cheap to rebuild
+        state = super(ObjectLayer, self).__getstate__()
+        state['_object_positions'] = None
+        state['_object_index'] = None
+        return state
+
+    @property
+    def columns(self):
+        if self.storage == 'columns':
+            return self.list
+        else:
+            return None
+
+    @contextlib.contextmanager
+    def modification_context(self):
+        if self.storage == 'columns':
+            # ObjectColumns converts all new objects before changing anything,
+            # so there is nothing to roll back
+            yield
+        else:
+            # Positions of objects can change, even if an exception is raised
+            self._object_positions = None
+            try:
+                with super(ObjectLayer, self).modification_context():
+                    yield
+            except:
+                # The objects were restored; the spatial index wasn't
+                self._object_index = None
+                raise
+            finally:
+                self._object_positions = None
+
+    # With 'columns' storage, ObjectColumns keeps the spatial index up to date
+    # as rows change
+
+    def __setitem__(self, index_or_name, value):
+        if self.storage == 'columns':
+            super(ObjectLayer, self).__setitem__(index_or_name, value)
+            return
+        if isinstance(index_or_name, slice) or self._object_index is None:
+            super(ObjectLayer, self).__setitem__(index_or_name, value)
+            self._object_index = None
+            return
+        index = self._get_index(index_or_name)
+        old = self[index]
+        super(ObjectLayer, self).__setitem__(index, value)
+        self._object_index.remove(old)
+        self._object_index.add(self[index])
+
+    def __delitem__(self, index_or_name):
+        if self.storage == 'columns':
+            super(ObjectLayer, self).__delitem__(index_or_name)
+            return
+        if isinstance(index_or_name, slice) or self._object_index is None:
+            super(ObjectLayer, self).__delitem__(index_or_name)
+            self._object_index = None
+            return
+        index = self._get_index(index_or_name)
+        old = self[index]
+        super(ObjectLayer, self).__delitem__(index)
+        self._object_index.remove(old)
+
+    def insert(self, index_or_name, value):
+        index = self._get_index(index_or_name)
+        # Find the resulting position, like list.insert does
+        index = slice(index, None).indices(len(self))[0]
+        super(ObjectLayer, self).insert(index, value)
+        if self._object_index is not None and self.storage != 'columns':
+            self._object_index.add(self[index])
+
+    def insert_after(self, index_or_name, value):
+        self.insert(self._get_index(index_or_name) + 1, value)
+
+    def _all_names(self):
+        if self.storage == 'columns':
+            # Renaming a column-stored object discards the index directly
+            return self.list.names
+        return super(ObjectLayer, self)._all_names()
+
+    def _get_object_index(self):
+        if self._object_index is None:
+            if self.storage == 'columns':
+                object_index = _ObjectGrid(self.map.tile_size,
+                                           self.list.pixel_bbox)
+                keys = range(len(self.list))
+            else:
+                object_index = _ObjectGrid(self.map.tile_size)
+                keys = self.list
+            for key in keys:
+                object_index.add(key)
+            self._object_index = object_index
+        return self._object_index
+
+    def _indexed_objects(self, keys):
+        """Return the objects for keys of the spatial index"""
+        if self.storage == 'columns':
+            return [self.list[row] for row in keys]
+        return keys
+
+    def objects_in_rect(self, rect):
+        """Return a list of objects whose bounding box overlaps a rectangle
+
+        `rect` is a (x, y, width, height) tuple, in pixels.
+        Objects that only touch the rectangle's edge are included.
+
+        The objects are returned in no particular order.
+        See :attr:`MapObject.pixel_bbox <tmxlib.mapobject.MapObject>` for
+        how the bounding boxes are computed.
+        """
+        x, y, width, height = rect
+        return self._indexed_objects(
+            self._get_object_index().in_box(x, y, x + width, y + height))
+
+    def objects_at(self, pixel_pos):
+        """Return a list of objects whose bounding box contains a point
+
+        `pixel_pos` is a (x, y) tuple, in pixels.
+        The objects are returned in no particular order.
+        """
+        x, y = pixel_pos
+        return self._indexed_objects(
+            self._get_object_index().in_box(x, y, x, y))
+
+    def nearest(self, pixel_pos, count=1):
+        """Return a list of the `count` objects nearest to a point
+
+        `pixel_pos` is a (x, y) tuple, in pixels.
+        Distance is measured to the nearest point of an object's bounding
+        box; it is zero for objects whose bounding box contains the point.
+        The objects are ordered from nearest to farthest.
+        """
+        x, y = pixel_pos
+        return self._indexed_objects(
+            self._get_object_index().nearest(x, y, count))
 
     def all_tiles(self):
         """Yield all tile objects in this layer, in order.
@@ -358,11 +993,36 @@ class ObjectLayer(Layer, helpers.NamedElementList):
             raise ValueError('Incompatible object')
         return item
 
-    def generate_draw_commands(self):
-        for obj in self:
+    def generate_draw_commands(self, rect=None):
+        """Yield commands to draw the layer's objects
+
+        If `rect`, an ``(x, y, width, height)`` tuple in pixels, is given,
+        only objects whose bounding box overlaps it are drawn; they are found
+        with the spatial index (see :meth:`objects_in_rect`).
+        """
+        if rect is None:
+            objects = self
+        else:
+            objects = self._in_layer_order(self.objects_in_rect(rect))
+        for obj in objects:
             for cmd in obj.generate_draw_commands():
                 yield cmd
 
+    def _in_layer_order(self, objects):
+        """Return the given objects of this layer in the layer's order
+
+        Objects that are in the layer several times are repeated.
+        """
+        if self.storage == 'columns':
+            return sorted(objects, key=operator.attrgetter('_row'))
+        positions = self._object_positions
+        if positions is None:
+            positions = self._object_positions = {}
+            for i, obj in enumerate(self.list):
+                positions.setdefault(id(obj), []).append(i)
+        return [obj for i, obj in sorted(
+            (i, obj) for obj in objects for i in positions[id(obj)])]
+
     def __nonzero__(self):
         return bool(len(self))
 
@@ -401,3 +1061,176 @@ class ObjectLayer(Layer, helpers.NamedElementList):
         for obj in dct.pop('objects', {}):
             self.append(mapobject.MapObject.from_dict(obj, self))
         return self
+
+
+class _ObjectGrid(object):
+    """Spatial index of objects: a uniform grid of cells
+
+    Each object is put in all the cells its bounding box overlaps, except
+    big objects, which are checked on every lookup instead.
+    An object may be added several times (as it can be in a layer several
+    times); it is only removed when it was removed as many times.
+
+    The indexed "objects" can be any keys; `pixel_bbox` gives the
+    (x, y, width, height) bounding box of a key. By default, keys are
+    objects and their ``pixel_bbox`` attribute is used.
+    """
+    # Objects that overlap more cells than this are "big"
+    max_cells = 64
+
+    def __init__(self, cell_size, pixel_bbox=None):
+        self.cell_width, self.cell_height = cell_size
+        self.pixel_bbox = pixel_bbox
+        self.cells = {}
+        self.big = set()
+        self.boxes = {}
+        self.counts = {}
+        self.cell_range = None
+
+    def _box(self, obj):
+        if self.pixel_bbox is None:
+            x, y, width, height = obj.pixel_bbox
+        else:
+            x, y, width, height = self.pixel_bbox(obj)
+        return x, y, x + width, y + height
+
+    def _cell_bounds(self, box):
+        """Return the range of cells (inclusive) to put an object box in
+
+        An edge that lies on a cell boundary does not put the object in the
+        cell beyond the boundary; lookups check that cell's neighbor too.
+        Tile-aligned objects are thus only in the cells of their tiles.
+        """
+        left, top, right, bottom = box
+        cell_left = int(left // self.cell_width)
+        cell_top = int(top // self.cell_height)
+        return (cell_left, cell_top,
+                max(cell_left, int(-(-right // self.cell_width)) - 1),
+                max(cell_top, int(-(-bottom // self.cell_height)) - 1))
+
+    def _lookup_cell_bounds(self, left, top, right, bottom):
+        """Return the range of cells (inclusive) to look up a box in"""
+        return (int(-(-left // self.cell_width)) - 1,
+                int(-(-top // self.cell_height)) - 1,
+                int(right // self.cell_width),
+                int(bottom // self.cell_height))
+
+    def add(self, obj):
+        count = self.counts.get(obj, 0)
+        self.counts[obj] = count + 1
+        if not count:
+            self._insert(obj)
+
+    def remove(self, obj):
+        count = self.counts.get(obj, 0)
+        if count > 1:
+            self.counts[obj] = count - 1
+        elif count:
+            del self.counts[obj]
+            self._delete(obj)
+
+    def update(self, obj):
+        if obj in self.boxes:
+            self._delete(obj)
+            self._insert(obj)
+
+    def _insert(self, obj):
+        box = self.boxes[obj] = self._box(obj)
+        left, top, right, bottom = bounds = self._cell_bounds(box)
+        if (right - left + 1) * (bottom - top + 1) > self.max_cells:
+            self.big.add(obj)
+            return
+        for cell_y in range(top, bottom + 1):
+            for cell_x in range(left, right + 1):
+                self.cells.setdefault((cell_x, cell_y), []).append(obj)
+        if self.cell_range is None:
+            self.cell_range = bounds
+        else:
+            old_left, old_top, old_right, old_bottom = self.cell_range
+            self.cell_range = (min(left, old_left), min(top, old_top),
+                               max(right, old_right), max(bottom, old_bottom))
+
+    def _delete(self, obj):
+        box = self.boxes.pop(obj)
+        if obj in self.big:
+            self.big.remove(obj)
+            return
+        left, top, right, bottom = self._cell_bounds(box)
+        for cell_y in range(top, bottom + 1):
+            for cell_x in range(left, right + 1):
+                cell = self.cells[cell_x, cell_y]
+                cell.remove(obj)
+                if not cell:
+                    del self.cells[cell_x, cell_y]
+
+    def in_box(self, left, top, right, bottom):
+        """Return objects whose boxes overlap the given (closed) box"""
+        cell_left, cell_top, cell_right, cell_bottom = (
+            self._lookup_cell_bounds(left, top, right, bottom))
+        num_cells = (cell_right - cell_left + 1) * (cell_bottom - cell_top + 1)
+        if num_cells > len(self.cells):
+            candidates = self.boxes
+        else:
+            candidates = set(self.big)
+            for cell_y in range(cell_top, cell_bottom + 1):
+                for cell_x in range(cell_left, cell_right + 1):
+                    candidates.update(self.cells.get((cell_x, cell_y), ()))
+        result = []
+        for obj in candidates:
+            obj_left, obj_top, obj_right, obj_bottom = self.boxes[obj]
+            if (obj_left <= right and left <= obj_right and
+                    obj_top <= bottom and top <= obj_bottom):
+                result.append(obj)
+        return result
+
+    def _distance(self, obj, x, y):
+        left, top, right, bottom = self.boxes[obj]
+        dx = max(left - x, 0, x - right)
+        dy = max(top - y, 0, y - bottom)
+        return math.hypot(dx, dy)
+
+    def nearest(self, x, y, count):
+        """Return the `count` objects nearest to a point, nearest first"""
+        if count <= 0:
+            return []
+        center_x = int(x // self.cell_width)
+        center_y = int(y // self.cell_height)
+        candidates = set(self.big)
+        if self.cell_range is None:
+            max_radius = -1
+        else:
+            left, top, right, bottom = self.cell_range
+            max_radius = max(center_x - left, right - center_x,
+                             center_y - top, bottom - center_y)
+        # Objects that are not in cells up to `radius` cells away from the
+        # point's cell are at least `radius * step` pixels away
+        step = min(self.cell_width, self.cell_height)
+        radius = 0
+        while radius <= max_radius:
+            if radius and 8 * radius > len(self.cells):
+                # Cheaper to look at all the remaining objects
+                candidates.update(self.boxes)
+                break
+            for cell in _ring(center_x, center_y, radius):
+                candidates.update(self.cells.get(cell, ()))
+            if len(candidates) >= count:
+                distances = heapq.nsmallest(
+                    count, (self._distance(obj, x, y) for obj in candidates))
+                if distances[-1] <= radius * step:
+                    break
+            radius += 1
+        return heapq.nsmallest(
+            count, candidates, key=lambda obj: self._distance(obj, x, y))
+
+
+def _ring(center_x, center_y, radius):
+    """Yield cells at the given Chebyshev distance from a center cell"""
+    if radius == 0:
+        yield center_x, center_y
+        return
+    for x in range(center_x - radius, center_x + radius + 1):
+        yield x, center_y - radius
+        yield x, center_y + radius
+    for y in range(center_y - radius + 1, center_y + radius):
+        yield center_x - radius, y
+        yield center_x + radius, y
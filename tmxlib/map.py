@@ -4,7 +4,7 @@ from __future__ import division
 
 import itertools
 
-from tmxlib import helpers, fileio, tileset, layer
+from tmxlib import helpers, fileio, tileset, layer, draw
 
 
 class Map(fileio.ReadWriteBase, helpers.SizeMixin):
@@ -169,30 +169,109 @@ class Map(fileio.ReadWriteBase, helpers.SizeMixin):
             if layer.type == 'tiles':
                 yield layer[x, y]
 
-    def check_consistency(self):
+    def check_consistency(self, report=False):
         """Check that this map is okay.
 
         Most checks are done when reading a map, but if more are required,
         call this method after reading.
         This will do a more expensive check than what's practical from within
         readers.
+
+        Checked are the GIDs of tiles and tile objects, and the terrain
+        indices of tileset tiles.
+
+        By default, an AssertionError is raised if there is a problem.
+        If `report` is true, a list of all problems found is returned
+        instead (as strings that give the location of each problem).
         """
-        large_gid = self.end_gid
-        for tile in self.all_tiles():
-            assert tile.gid < large_gid
+        problems = []
+        end_gid = self.end_gid
+        for map_layer in self.layers:
+            if map_layer.type == 'tiles':
+                for x, y, gid in map_layer._gids_out_of_range(end_gid):
+                    problems.append('Layer %s, tile (%s, %s): GID %s '
+                                    'not in map' % (map_layer.name, x, y, gid))
+            for obj in map_layer.all_objects():
+                if obj.objtype == 'tile' and obj.gid >= end_gid:
+                    problems.append('Layer %s, object at %s: GID %s not '
+                                    'in map' % (map_layer.name, obj.pos,
+                                                obj.gid))
+        for map_tileset in self.tilesets:
+            num_terrains = len(map_tileset.terrains)
+            for number, attrs in sorted(map_tileset.tile_attributes.items()):
+                for index in attrs.get('terrain_indices', ()):
+                    if index != -1 and not 0 <= index < num_terrains:
+                        problems.append('Tileset %s, tile %s: bad terrain '
+                                        'index %s' % (map_tileset.name,
+                                                      number, index))
+        if report:
+            return problems
+        elif problems:
+            message = problems[0]
+            if len(problems) > 1:
+                message += ' (and %s more problems)' % (len(problems) - 1)
+            raise AssertionError(message)
+
+    def generate_draw_commands(self, rect=None):
+        """Yield commands to draw the visible layers of the map
+
+        If `rect`, an ``(x, y, width, height)`` tuple in pixels, is given,
+        layers only generate commands for what can be visible in it.
+        """
+        return itertools.chain.from_iterable(
+            layer.generate_draw_commands(rect)
+            for layer in self.layers if layer.visible)
+
+    def generate_batched_draw_commands(self, rect=None):
+        """Like generate_draw_commands, but batch the images of each layer
 
-    def generate_draw_commands(self):
+        See :func:`tmxlib.draw.batch_commands`.
+        """
         return itertools.chain.from_iterable(
-            layer.generate_draw_commands()
+            draw.batch_commands(layer.generate_draw_commands(rect))
             for layer in self.layers if layer.visible)
 
-    def render(self):
+    def render(self, rect=None, tile_rect=None):
+        """Render the map to a new :class:`~tmxlib.canvas.Canvas`
+
+        By default, the whole map is rendered.
+        To render only a part of it, give either `rect`, an
+        ``(x, y, width, height)`` tuple in pixels, or `tile_rect`, the same
+        in tiles. The canvas then has the size of the rectangle, and only
+        the tiles and objects that can be visible in it are drawn.
+        The rectangle may extend outside the map.
+        """
         from tmxlib.canvas import Canvas
-        canvas = Canvas(self.pixel_size,
+        if tile_rect is not None:
+            if rect is not None:
+                raise TypeError('Cannot give both rect and tile_rect')
+            x, y, width, height = tile_rect
+            tile_width, tile_height = self.tile_size
+            rect = (x * tile_width, y * tile_height,
+                    width * tile_width, height * tile_height)
+        if rect is None:
+            size = self.pixel_size
+            commands = self.generate_batched_draw_commands()
+        else:
+            x, y, width, height = rect
+            size = width, height
+            commands = (
+                command.translated((-x, -y)) for command in
+                self.generate_batched_draw_commands(rect))
+        canvas = Canvas(size,
                         #color=self.background_color,
-                        commands=self.generate_draw_commands())
+                        commands=commands)
         return canvas
 
+    def render_pyramid(self, directory, tile_size=256, min_zoom=0):
+        """Render the map into a pyramid of PNG images in a directory
+
+        See :func:`tmxlib.pyramid.render_pyramid`.
+        """
+        from tmxlib.pyramid import render_pyramid
+        return render_pyramid(self, directory, tile_size=tile_size,
+                              min_zoom=min_zoom)
+
     def _repr_png_(self):
         return self.render()._repr_png_()
 
@@ -3,14 +3,17 @@
 
 from __future__ import division
 
+import array
+import weakref
+import collections
 
-from tmxlib import helpers, tile, draw
+from tmxlib import helpers, tile, draw, fileio
 
 
 NOT_GIVEN = object()
 
 
-class MapObject(helpers.LayerElementMixin):
+class MapObject(helpers.LayerElementMixin, helpers.SlotsPickleMixin):
     """A map object: something that's not placed on the fixed grid
 
     Has several subclasses.
@@ -65,6 +68,12 @@ class MapObject(helpers.LayerElementMixin):
 
             The map associated with this object
 
+        .. attribute:: pixel_bbox
+
+            The bounding box of this object, as a (x, y, width, height)
+            tuple, in pixels. Note that unlike `pixel_pos`, (x, y) is the
+            top-left corner.
+
     Unpacked position attributes:
 
         .. attribute:: x
@@ -72,15 +81,37 @@ class MapObject(helpers.LayerElementMixin):
         .. attribute:: pixel_x
         .. attribute:: pixel_y
     """
+    __slots__ = ('layer', '_pixel_pos', '_name', 'type', 'properties',
+                 '__weakref__')
     pixel_x, pixel_y = helpers.unpacked_properties('pixel_pos')
+    name = helpers.NameProperty()
 
     def __init__(self, layer, pixel_pos, name=None, type=None):
         self.layer = layer
-        self.pixel_pos = pixel_pos
+        self._pixel_pos = pixel_pos
         self.name = name
         self.type = type
         self.properties = {}
 
+    @property
+    def pixel_pos(self):
+        return self._pixel_pos
+    @pixel_pos.setter
+    def pixel_pos(self, value):
+        self._pixel_pos = value
+        self._moved()
+
+    @property
+    def pixel_bbox(self):
+        x, y = self.pixel_pos
+        return x, y, 0, 0
+
+    def _moved(self):
+        """Update the layer's spatial index after the bounding box changed"""
+        index = getattr(self.layer, '_object_index', None)
+        if index is not None:
+            index.update(self)
+
     @property
     def pos(self):
         return (self.pixel_pos[0] / self.layer.map.tile_width,
@@ -132,10 +163,30 @@ class MapObject(helpers.LayerElementMixin):
 
 
 class PointBasedObject(MapObject):
+    __slots__ = ('_points',)
+
     def __init__(self, layer, pixel_pos, size=None, pixel_size=None, name=None,
             type=None, points=()):
         MapObject.__init__(self, layer, pixel_pos, name, type)
-        self.points = list(points)
+        self._points = list(points)
+
+    @property
+    def points(self):
+        return self._points
+    @points.setter
+    def points(self, value):
+        self._points = list(value)
+        self._moved()
+
+    @property
+    def pixel_bbox(self):
+        x, y = self.pixel_pos
+        if not self.points:
+            return x, y, 0, 0
+        xs = [px for px, py in self.points]
+        ys = [py for px, py in self.points]
+        return (x + min(xs), y + min(ys),
+                max(xs) - min(xs), max(ys) - min(ys))
 
     @helpers.from_dict_method
     def from_dict(cls, dct, layer):
@@ -167,8 +218,15 @@ class PolygonObject(PointBasedObject):
 
             The format is list of iterables:
             [(x0, y0), (x1, y1), ..., (xn, yn)]
+
+            The points are relative to `pixel_pos`.
+            If objects of the layer are indexed (see
+            :meth:`ObjectLayer.objects_in_rect
+            <tmxlib.layer.ObjectLayer.objects_in_rect>`),
+            assign a new list instead of changing the points in place.
     """
 
+    __slots__ = ()
     objtype = 'polygon'
 
 
@@ -180,10 +238,13 @@ class PolylineObject(PointBasedObject):
     Has the same ``points`` attribute/argument as
     :class:`~tmxlib.mapobject.PolygonObject`.
     """
+    __slots__ = ()
     objtype = 'polyline'
 
 
 class SizedObject(helpers.TileMixin, MapObject):
+    __slots__ = ('_size',)
+
     def __init__(self, layer, pixel_pos, size=None, pixel_size=None, name=None,
             type=None):
         MapObject.__init__(self, layer, pixel_pos, name, type)
@@ -200,6 +261,17 @@ class SizedObject(helpers.TileMixin, MapObject):
     @pixel_size.setter
     def pixel_size(self, value):
         self._size = value
+        self._moved()
+
+    @property
+    def pixel_bbox(self):
+        x, y = self.pixel_pos
+        try:
+            width, height = self.pixel_size
+        except AttributeError:
+            # Size not set
+            width = height = 0
+        return x, y - height, width, height
 
     def to_dict(self, gid=None):
         """Export to a dict compatible with Tiled's JSON plugin"""
@@ -261,6 +333,7 @@ class RectangleObject(tile.TileLikeObject, SizedObject):
     See :class:`tmxlib.tile.TileLikeObject` for attributes and methods
     shared with tiles.
     """
+    __slots__ = ('_value',)
 
     def __init__(self, layer, pixel_pos, size=None, pixel_size=None, name=None,
             type=None, value=0):
@@ -274,6 +347,12 @@ class RectangleObject(tile.TileLikeObject, SizedObject):
         return True
     __bool__ = __nonzero__
 
+    @tile.TileLikeObject.value.setter
+    def value(self, new):
+        # The size of tile objects comes from the tile
+        tile.TileLikeObject.value.fset(self, new)
+        self._moved()
+
     @property
     def objtype(self):
         if self.value:
@@ -294,6 +373,7 @@ class RectangleObject(tile.TileLikeObject, SizedObject):
                 raise TypeError("Cannot modify size of tile objects")
         else:
             self._size = value
+            self._moved()
 
     def generate_draw_commands(self):
         if self.value:
@@ -301,6 +381,7 @@ class RectangleObject(tile.TileLikeObject, SizedObject):
                 image=self.image,
                 pos=(self.pixel_x, self.pixel_y - self.pixel_height),
                 opacity=self.layer.opacity,
+                flags=self.flags,
             )
         else:
             # TODO: Rectangle objects
@@ -356,6 +437,7 @@ class EllipseObject(SizedObject):
         .. attribute:: pixel_width
         .. attribute:: pixel_height
     """
+    __slots__ = ()
 
     objtype = 'ellipse'
     @helpers.from_dict_method
@@ -369,3 +451,395 @@ class EllipseObject(SizedObject):
         result = super(EllipseObject, self).to_dict()
         result['ellipse'] = True
         return result
+
+
+ObjectRow = collections.namedtuple('ObjectRow', [
+    'objtype', 'pixel_x', 'pixel_y', 'pixel_width', 'pixel_height', 'value',
+    'name', 'type', 'properties', 'points'])
+
+
+def _number(value):
+    """Return a float from a column as an int, if it is integral"""
+    if value == int(value):
+        return int(value)
+    return value
+
+
+class ObjectColumns(object):
+    """Column storage for the objects of an ObjectLayer
+
+    Used by object layers with ``storage='columns'``.
+    Positions, sizes, values, names, types, properties and points of the
+    objects are kept in parallel arrays and lists, one row per object.
+    Objects are only created when a row is accessed: they are instances
+    of subclasses of the regular object classes, which read and write their
+    row.
+    An object stays the same while anything references it, and follows its
+    row when rows are inserted or removed before it.
+    Objects removed from the layer keep their values, and can be put back.
+
+    Objects that are stored in the layer are copied to a new row, so
+    changing the original object afterwards does not change the layer.
+    Take the stored object from the layer instead.
+
+    Acts as a list of objects, which the layer uses as its
+    :class:`~tmxlib.helpers.NamedElementList` storage.
+
+    init arguments, which become attributes:
+
+        .. attribute:: layer
+
+            The layer the objects belong to
+    """
+    objtypes = 'rectangle', 'ellipse', 'polygon', 'polyline'
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.kinds = array.array('B')
+        self.xs = array.array('d')
+        self.ys = array.array('d')
+        self.widths = array.array('d')
+        self.heights = array.array('d')
+        self.values = array.array(fileio.GID_TYPECODE)
+        self.names = []
+        self.types = []
+        self.properties = []
+        self.points = []
+        self._proxies = weakref.WeakValueDictionary()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_proxies']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._proxies = weakref.WeakValueDictionary()
+
+    def _columns(self):
+        return (self.kinds, self.xs, self.ys, self.widths, self.heights,
+                self.values, self.names, self.types, self.properties,
+                self.points)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self._proxy(row)
+
+    def __contains__(self, item):
+        return getattr(item, '_columns', None) is self
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._proxy(row)
+                    for row in range(*index.indices(len(self)))]
+        return self._proxy(self._row_index(index))
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                rows = range(start, stop, step)
+                value = list(value)
+                if len(value) != len(rows):
+                    raise ValueError(
+                        'attempt to assign sequence of size %s to extended '
+                        'slice of size %s' % (len(value), len(rows)))
+                for row, obj in zip(rows, value):
+                    self[row] = obj
+                return
+            self._splice(start, max(start, stop), value)
+        else:
+            row = self._row_index(index)
+            self._splice(row, row + 1, [value])
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                for row in sorted(range(start, stop, step), reverse=True):
+                    del self[row]
+                return
+            self._splice(start, max(start, stop), [])
+        else:
+            row = self._row_index(index)
+            self._splice(row, row + 1, [])
+
+    def insert(self, index, obj):
+        """Insert an object before the given index, like list.insert"""
+        index = slice(index, None).indices(len(self))[0]
+        self._splice(index, index, [obj])
+
+    def append(self, obj):
+        """Append an object"""
+        self.insert(len(self), obj)
+
+    def add_row(self, objtype, pixel_pos, pixel_size=None, value=0,
+                name=None, type=None, points=None, properties=None):
+        """Append an object given by its values, without creating it
+
+        `objtype` is ``'rectangle'``, ``'ellipse'``, ``'polygon'`` or
+        ``'polyline'`` (tile objects are rectangles with a non-zero value).
+        The other arguments are as for the corresponding object class.
+        """
+        kind = self.objtypes.index(objtype)
+        width, height = pixel_size or (0, 0)
+        if points is not None:
+            points = list(points)
+        row = (kind, pixel_pos[0], pixel_pos[1], width, height, value,
+               name, type, properties or None, points)
+        for column, item in zip(self._columns(), row):
+            column.append(item)
+        self._rows_changed(len(self) - 1, len(self) - 1, 1)
+        # The layer's name index does not know about the new row
+        self.layer._name_index = None
+
+    def pixel_bbox(self, row):
+        """Return the bounding box of the object in a row, without creating it
+
+        The result is the object's
+        :attr:`~tmxlib.mapobject.MapObject.pixel_bbox`.
+        """
+        x = _number(self.xs[row])
+        y = _number(self.ys[row])
+        kind = self.kinds[row]
+        if kind >= 2:
+            points = self.points[row]
+            if not points:
+                return x, y, 0, 0
+            xs = [px for px, py in points]
+            ys = [py for px, py in points]
+            return (x + min(xs), y + min(ys),
+                    max(xs) - min(xs), max(ys) - min(ys))
+        value = self.values[row]
+        gid = value & tile.TileLikeObject.gid.value
+        if gid:
+            tileset_tile = self.layer.map.tilesets.tileset_tile(gid)
+            width, height = tileset_tile.pixel_size
+            if value & tile.TileLikeObject.flipped_diagonally.value:
+                width, height = height, width
+        else:
+            width = _number(self.widths[row])
+            height = _number(self.heights[row])
+        return x, y - height, width, height
+
+    def _rows_changed(self, start, stop, count):
+        """Update the layer's spatial index after rows were replaced
+
+        Rows `start` to `stop` were replaced by `count` new rows.
+        The index holds row numbers, so it is discarded if other rows moved.
+        """
+        layer = self.layer
+        index = getattr(layer, '_object_index', None)
+        if index is None or layer.columns is not self:
+            return
+        old_length = len(self) - count + (stop - start)
+        if count != stop - start and stop != old_length:
+            layer._object_index = None
+            return
+        common = min(count, stop - start)
+        for row in range(start, start + common):
+            index.update(row)
+        for row in range(start + common, stop):
+            index.remove(row)
+        for row in range(start + common, start + count):
+            index.add(row)
+
+    def rows(self):
+        """Yield an :class:`ObjectRow` for each object, without creating it
+
+        The `objtype`, `properties` and `points` fields hold what the
+        corresponding object attributes would.
+        """
+        for (kind, x, y, width, height, value, name, type, properties,
+                points) in zip(*self._columns()):
+            if value:
+                objtype = 'tile'
+            else:
+                objtype = self.objtypes[kind]
+            yield ObjectRow(
+                objtype, _number(x), _number(y), _number(width),
+                _number(height), value, name, type, properties or {},
+                points)
+
+    def _row_index(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('object index out of range')
+        return index
+
+    def _proxy(self, row):
+        try:
+            return self._proxies[row]
+        except KeyError:
+            cls = _column_object_classes[self.kinds[row]]
+            proxy = self._proxies[row] = cls(self.layer, self, row)
+            return proxy
+
+    def _row_values(self, obj):
+        """Return the column values for a new row holding a copy of `obj`"""
+        objtype = obj.objtype
+        if objtype == 'tile':
+            objtype = 'rectangle'
+        kind = self.objtypes.index(objtype)
+        value = width = height = 0
+        points = None
+        if kind == 0:
+            value = obj.value
+        if kind >= 2:
+            points = list(obj.points)
+        elif not value:
+            width, height = obj.pixel_size
+        x, y = obj.pixel_pos
+        return (kind, x, y, width, height, value, obj.name, obj.type,
+                dict(obj.properties) or None, points)
+
+    def _splice(self, start, stop, objects):
+        """Replace rows start to stop with copies of the given objects"""
+        objects = list(objects)
+        rows = [self._row_values(obj) for obj in objects]
+        proxies = dict(self._proxies)
+        for row, proxy in proxies.items():
+            if start <= row < stop:
+                proxy._detach()
+        columns = self._columns()
+        for column, values in zip(columns,
+                                  list(zip(*rows)) or [()] * len(columns)):
+            if isinstance(column, array.array):
+                values = array.array(column.typecode, values)
+            column[start:stop] = values
+        self._proxies = weakref.WeakValueDictionary()
+        offset = len(rows) - (stop - start)
+        for row, proxy in proxies.items():
+            if row < start:
+                self._proxies[row] = proxy
+            elif row >= stop:
+                proxy._row = row + offset
+                self._proxies[row + offset] = proxy
+        for row, obj in enumerate(objects, start):
+            # Objects removed from the layer earlier take the new row
+            if (isinstance(obj, _ColumnObjectMixin) and
+                    obj._columns is not self and obj.layer is self.layer):
+                obj._columns = self
+                obj._row = row
+                self._proxies[row] = obj
+        self._rows_changed(start, stop, len(rows))
+
+
+class _ColumnName(helpers.NameProperty):
+    """The name of an object in ObjectColumns
+
+    Objects are short-lived proxies, so renaming one discards the name index
+    of its layer directly.
+    """
+    def watch(self, instance, lst):
+        pass
+
+    def renamed(self, instance):
+        instance._columns.layer._name_index = None
+
+    def get(self, instance):
+        return instance._columns.names[instance._row]
+
+    def set(self, instance, value):
+        instance._columns.names[instance._row] = value
+
+
+class _ColumnObjectMixin(object):
+    """Reads and writes attributes of an object in ObjectColumns"""
+    __slots__ = ()
+
+    def __init__(self, layer, columns, row):
+        self.layer = layer
+        self._columns = columns
+        self._row = row
+
+    def __getstate__(self):
+        return dict(layer=self.layer, _columns=self._columns, _row=self._row)
+
+    def _detach(self):
+        """Move this object's values to columns of its own"""
+        ObjectColumns(self.layer)._splice(0, 0, [self])
+
+    def _moved(self):
+        # The layer's spatial index holds row numbers
+        index = getattr(self.layer, '_object_index', None)
+        if index is not None and self.layer.columns is self._columns:
+            index.update(self._row)
+
+    @property
+    def _pixel_pos(self):
+        columns = self._columns
+        return (_number(columns.xs[self._row]),
+                _number(columns.ys[self._row]))
+    @_pixel_pos.setter
+    def _pixel_pos(self, value):
+        self._columns.xs[self._row], self._columns.ys[self._row] = value
+
+    @property
+    def _size(self):
+        columns = self._columns
+        return (_number(columns.widths[self._row]),
+                _number(columns.heights[self._row]))
+    @_size.setter
+    def _size(self, value):
+        columns = self._columns
+        columns.widths[self._row], columns.heights[self._row] = value
+
+    @property
+    def _value(self):
+        return self._columns.values[self._row]
+    @_value.setter
+    def _value(self, value):
+        self._columns.values[self._row] = value
+
+    name = _ColumnName()
+
+    @property
+    def type(self):
+        return self._columns.types[self._row]
+    @type.setter
+    def type(self, value):
+        self._columns.types[self._row] = value
+
+    @property
+    def properties(self):
+        properties = self._columns.properties
+        result = properties[self._row]
+        if result is None:
+            result = properties[self._row] = {}
+        return result
+    @properties.setter
+    def properties(self, value):
+        self._columns.properties[self._row] = value
+
+    @property
+    def _points(self):
+        return self._columns.points[self._row]
+    @_points.setter
+    def _points(self, value):
+        self._columns.points[self._row] = value
+
+
+class _ColumnRectangleObject(_ColumnObjectMixin, RectangleObject):
+    __slots__ = ('_columns', '_row')
+
+
+class _ColumnEllipseObject(_ColumnObjectMixin, EllipseObject):
+    __slots__ = ('_columns', '_row')
+
+
+class _ColumnPolygonObject(_ColumnObjectMixin, PolygonObject):
+    __slots__ = ('_columns', '_row')
+
+
+class _ColumnPolylineObject(_ColumnObjectMixin, PolylineObject):
+    __slots__ = ('_columns', '_row')
+
+
+# Indexed by ObjectColumns.kinds
+_column_object_classes = (_ColumnRectangleObject, _ColumnEllipseObject,
+                          _ColumnPolygonObject, _ColumnPolylineObject)
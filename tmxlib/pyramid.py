@@ -0,0 +1,97 @@
+"""Renders maps into tile pyramids
+
+A pyramid is a set of PNG images of a fixed size, in a ``z/x/y.png``
+directory layout as used by web map viewers.
+Zoom level 0 shows the whole map in a single image; each following level
+doubles the resolution, up to the highest level, which shows the map at its
+actual size.
+
+This module requires PIL_ (or Pillow_) to be installed.
+
+.. _Pillow: https://pypi.python.org/pypi/Pillow/2.2.1
+.. _PIL: http://www.pythonware.com/products/pil/
+"""
+
+from __future__ import division
+
+import os
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    raise ImportError(
+        'The PIL library (Pillow on PyPI) is needed for pyramids')
+
+# ANTIALIAS was removed in Pillow 10; LANCZOS is missing in old versions of PIL
+_RESAMPLE = getattr(Image, 'LANCZOS', None) or Image.ANTIALIAS
+
+
+def max_zoom(map, tile_size=256):
+    """Return the zoom level at which a map is shown at its actual size
+
+    At that level, the map fits in ``2 ** max_zoom`` tiles in each direction.
+    """
+    zoom = 0
+    while max(map.pixel_size) > tile_size << zoom:
+        zoom += 1
+    return zoom
+
+
+def render_pyramid(map, directory, tile_size=256, min_zoom=0):
+    """Render a map into a pyramid of PNG images
+
+    :param map: The :class:`~tmxlib.map.Map` to render
+    :param directory: Directory to write the images to, as
+        ``directory/z/x/y.png``. Subdirectories are created as needed.
+    :param tile_size: Width and height of the images, in pixels
+    :param min_zoom: Images of zoom levels lower than this are not written
+    :return: A list of ``(z, x, y)`` tuples of the images written
+
+    Only the highest zoom level is rendered (see
+    :meth:`Map.render <tmxlib.map.Map.render>`); lower levels are made by
+    downsampling it.
+    Images are produced depth-first, so only a few of them are in memory at
+    a time.
+    Completely transparent images are not written.
+    """
+    top_zoom = max_zoom(map, tile_size)
+    written = []
+
+    def save(pil_image, z, x, y):
+        if z < min_zoom:
+            return
+        path = os.path.join(directory, str(z), str(x))
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        pil_image.save(os.path.join(path, '%s.png' % y), 'PNG')
+        written.append((z, x, y))
+
+    def tile(z, x, y):
+        """Return the PIL image of the given tile, or None if it is empty"""
+        if z == top_zoom:
+            map_width, map_height = map.pixel_size
+            if x * tile_size >= map_width or y * tile_size >= map_height:
+                return None
+            rect = x * tile_size, y * tile_size, tile_size, tile_size
+            pil_image = map.render(rect=rect).pil_image
+            if pil_image.getbbox() is None:
+                return None
+        else:
+            children = [(dx, dy, tile(z + 1, x * 2 + dx, y * 2 + dy))
+                        for dy in (0, 1) for dx in (0, 1)]
+            if all(child is None for dx, dy, child in children):
+                return None
+            pil_image = Image.new('RGBA', (tile_size * 2, tile_size * 2),
+                                  color=(0, 0, 0, 0))
+            for dx, dy, child in children:
+                if child is not None:
+                    pil_image.paste(child, (dx * tile_size, dy * tile_size))
+            # Resize with premultiplied alpha, so transparent pixels don't
+            # darken their neighbors
+            pil_image = pil_image.convert('RGBa').resize(
+                (tile_size, tile_size), _RESAMPLE).convert('RGBA')
+        save(pil_image, z, x, y)
+        return pil_image
+
+    tile(0, 0, 0)
+    return written
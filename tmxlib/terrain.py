@@ -14,7 +14,7 @@ class TerrainList(helpers.NamedElementList):
         self.append(Terrain(name, tile))
 
 
-class Terrain(object):
+class Terrain(helpers.SlotsPickleMixin):
     """Represents a Tiled terrain
 
     Init arguments, which become attributes:
@@ -29,6 +29,9 @@ class Terrain(object):
             same tileset.
 
     """
+    __slots__ = ('_name', 'tile', '__weakref__')
+    name = helpers.NameProperty()
+
     def __init__(self, name, tile):
         self.name = name
         self.tile = tile
@@ -5,7 +5,7 @@ from __future__ import division
 from tmxlib import helpers
 
 
-class TileLikeObject(helpers.TileMixin):
+class TileLikeObject(helpers.TileMixin, helpers.SlotsPickleMixin):
     """Base tile-like object: regular tile or tile object.
 
     Has an associated layer and value, and can be flipped, etc.
@@ -18,6 +18,8 @@ class TileLikeObject(helpers.TileMixin):
         Subclasses should use the `_value` attribute for your own purposes.
         The `value` allows setting itself to TilesetTiles, has checks, etc.
     """
+    __slots__ = ()
+
     def __nonzero__(self):
         """This object is "true" iff there's a tile associated with it.
 
@@ -55,6 +57,8 @@ class TileLikeObject(helpers.TileMixin):
             - flipped_diagonally (0x20000000)
             - gid (0x0FFFFFFF)
 
+        The `flags` property holds all three flip bits (0xE0000000).
+
         The properties themselves have a `value` attribute, e.g.
         ``tmxlib.MapTile.flipped_diagonally.value == 0x20000000``.
         """
@@ -84,6 +88,7 @@ class TileLikeObject(helpers.TileMixin):
     flipped_horizontally = __mask_property(0x80000000, bool, 31)
     flipped_vertically = __mask_property(0x40000000, bool, 30)
     flipped_diagonally = __mask_property(0x20000000, bool, 29)
+    flags = __mask_property(0xE0000000)
 
     def _tileset_tile(self, tilesets):
         # Get the referenced tileset tile given a list of tilesets
@@ -105,7 +110,15 @@ class TileLikeObject(helpers.TileMixin):
     @property
     def tileset_tile(self):
         """Get the referenced tileset tile"""
-        return self._tileset_tile(self.map.tilesets)
+        tilesets = self.map.tilesets
+        try:
+            lookup = tilesets.tileset_tile
+        except AttributeError:
+            # Plain list of tilesets
+            return self._tileset_tile(tilesets)
+        if self.gid == 0:
+            return None
+        return lookup(self.gid)
 
     @property
     def tileset(self):
@@ -121,7 +134,7 @@ class TileLikeObject(helpers.TileMixin):
         """Get the number of the referenced tileset tile"""
         tileset_tile = self.tileset_tile
         if tileset_tile:
-            return self.tileset_tile.number
+            return tileset_tile.number
         else:
             return 0
 
@@ -131,8 +144,10 @@ class TileLikeObject(helpers.TileMixin):
 
         N.B. No transformations are applied to the image. This can change in
         future versions. Use self.tileset_tile.image for future-safe behavior.
+
+        Draw commands generated for tiles apply the transformations
+        (see :attr:`DrawImageCommand.flags <tmxlib.draw.DrawImageCommand>`).
         """
-        # XXX: Apply transformations... ?
         tileset_tile = self.tileset_tile
         if tileset_tile:
             return self.tileset_tile.image
@@ -227,26 +242,42 @@ class MapTile(TileLikeObject):
 
             The associated coordinates, as (x, y), in tile coordinates.
 
+    Other attributes, taken from the layer's map when the MapTile is created:
+
+        .. attribute:: map
+
+            The map of the layer.
+
+        .. attribute:: tile_size
+
+            The map's tile size, in pixels.
+
     See :class:`~tmxlib.tile.TileLikeObject` for attributes and methods
     shered with tile objects.
 
     """
+    __slots__ = ('layer', 'map', 'tile_size', '_pos')
+
     def __init__(self, layer, pos):
         self.layer = layer
+        self.map = map = layer.map
+        self.tile_size = map.tile_size
         x, y = pos
-        if x < 0:
-            x += layer.map.width
-        if y < 0:
-            y += layer.map.height
+        if x < 0 or y < 0:
+            width, height = map.size
+            if x < 0:
+                x += width
+            if y < 0:
+                y += height
         self._pos = x, y
 
     @property
     def _value(self):
         """Use `value` instead."""
-        return self.layer.value_at(self.pos)
+        return self.layer.value_at(self._pos)
     @_value.setter
     def _value(self, new):
-        return self.layer.set_value_at(self.pos, new)
+        return self.layer.set_value_at(self._pos, new)
 
     def __repr__(self):
         flagstring = ''.join(f for (f, v) in zip('HVD', (
@@ -263,8 +294,9 @@ class MapTile(TileLikeObject):
 
     @property
     def pixel_pos(self):
-        px_parent = self.map.tile_size
-        return self.x * px_parent[0], (self.y + 1) * px_parent[1]
+        x, y = self._pos
+        tile_width, tile_height = self.tile_size
+        return x * tile_width, (y + 1) * tile_height
 
     def __eq__(self, other):
         try:
@@ -296,3 +328,36 @@ class MapTile(TileLikeObject):
             return tileset_tile.properties
         else:
             return {}
+
+
+class TileCursor(MapTile):
+    """A MapTile that can be moved around its layer
+
+    Looking at many tiles through one cursor avoids creating a MapTile
+    for each of them. Get a cursor with
+    :meth:`TileLayer.cursor <tmxlib.layer.TileLayer.cursor>`.
+
+    Since their position can change, cursors are not hashable.
+    """
+    __slots__ = ()
+    __hash__ = None
+
+    @property
+    def pos(self):
+        return self._pos
+    @pos.setter
+    def pos(self, pos):
+        self.move_to(*pos)
+
+    def move_to(self, x, y):
+        """Move the cursor to the given position
+
+        Supports negative indices by wrapping in the obvious way.
+        """
+        if x < 0 or y < 0:
+            width, height = self.map.size
+            if x < 0:
+                x += width
+            if y < 0:
+                y += height
+        self._pos = x, y
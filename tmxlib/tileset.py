@@ -2,12 +2,18 @@
 
 from __future__ import division
 
+import bisect
 import collections
 import contextlib
+import weakref
 
 from tmxlib import helpers, fileio, tile, image, terrain
 
 
+# Tileset lists whose GID index depends on the length of a tileset
+_gid_index_lists = helpers.ContainerRegistry()
+
+
 class TilesetList(helpers.NamedElementList):
     """A list of tilesets.
 
@@ -15,12 +21,23 @@ class TilesetList(helpers.NamedElementList):
 
     Whenever the list is changed, GIDs of tiles in the associated map are
     renumbered to match the new set of tilesets.
+
+    An index of the GIDs used by each tileset is cached, and recomputed only
+    after the list is modified (see :meth:`modification_context`), or after
+    the number of tiles in one of the tilesets changes.
     """
     def __init__(self, map, lst=None):
         self.map = map
         self._being_modified = False
+        self._gid_index = None
         super(TilesetList, self).__init__(lst)
 
+    def __getstate__(self):
+        # The GID index is keyed by object ids, which don't survive pickling
+        state = super(TilesetList, self).__getstate__()
+        state['_gid_index'] = None
+        return state
+
     @contextlib.contextmanager
     def modification_context(self):
         """Context manager that "wraps" modifications to the tileset list
@@ -39,6 +56,7 @@ class TilesetList(helpers.NamedElementList):
             yield
         else:
             self._being_modified = True
+            self._gid_index = None
             try:
                 with super(TilesetList, self).modification_context():
                     previous_tilesets = list(self.list)
@@ -50,6 +68,58 @@ class TilesetList(helpers.NamedElementList):
                         raise ValueError('Too many tiles to be represented')
             finally:
                 self._being_modified = False
+                self._gid_index = None
+
+    def _get_gid_index(self):
+        """Return a (first_gids, starts) tuple describing GIDs in the map
+
+        `first_gids` maps ids of tilesets to their first GID;
+        `starts` is the sorted list of first GIDs of all items of the list.
+        """
+        gid_index = self._gid_index
+        if gid_index is None:
+            first_gids = {}
+            starts = []
+            num = 1
+            for item in self.list:
+                first_gids.setdefault(id(item), num)
+                starts.append(num)
+                num += len(item)
+            gid_index = first_gids, starts
+            # While the list is being modified, the index could go stale
+            if not self._being_modified:
+                self._gid_index = gid_index
+                for item in self.list:
+                    _gid_index_lists.add(item, self)
+        return gid_index
+
+    def first_gid(self, tileset):
+        """Return the first gid used by the given tileset in the map
+
+        Raises TilesetNotInMapError if the tileset is not in the list.
+        """
+        first_gids, starts = self._get_gid_index()
+        try:
+            return first_gids[id(tileset)]
+        except KeyError:
+            error = helpers.TilesetNotInMapError('Tileset not in map')
+            error.tileset = tileset
+            raise error
+
+    def tileset_tile(self, gid):
+        """Return the TilesetTile that the given (nonzero) gid refers to
+
+        The tileset is found by binary search.
+        Raises ValueError if the gid is out of range.
+        """
+        first_gids, starts = self._get_gid_index()
+        index = bisect.bisect_right(starts, gid) - 1
+        if index >= 0:
+            tileset = self.list[index]
+            number = gid - starts[index]
+            if number < len(tileset):
+                return tileset[number]
+        raise ValueError('Invalid tile GID: %s' % gid)
 
     def _renumber_map(self, previous_tilesets):
         """Renumber tiles in the map after tilesets are changed
@@ -58,22 +128,53 @@ class TilesetList(helpers.NamedElementList):
 
         If an used tileset was removed, raise a ValueError. (Note that this
         method by itself won't restore the previous state.)
+
+        A table of old to new values is computed from the distinct values
+        in the map, and then applied to each tile layer in bulk.
+        Flags of the values are kept.
         """
-        gid_map = dict()
-        for tile in self.map.all_tiles():
-            if tile and tile.gid not in gid_map:
-                tileset_tile = tile._tileset_tile(previous_tilesets)
+        tile_layers = [l for l in self.map.layers if l.type == 'tiles']
+        tile_objects = [o for l in self.map.layers if l.type == 'objects'
+                        for o in l.all_tiles()]
+        values = set(obj.value for obj in tile_objects)
+        for layer in tile_layers:
+            values.update(layer._distinct_values())
+
+        previous_starts = []
+        num = 1
+        for tileset in previous_tilesets:
+            previous_starts.append(num)
+            num += len(tileset)
+
+        gid_mask = tile.TileLikeObject.gid.value
+        value_map = dict()
+        gid_map = {0: 0}
+        for value in values:
+            old_gid = value & gid_mask
+            try:
+                new_gid = gid_map[old_gid]
+            except KeyError:
+                index = bisect.bisect_right(previous_starts, old_gid) - 1
+                if index >= 0:
+                    number = old_gid - previous_starts[index]
+                if index < 0 or number >= len(previous_tilesets[index]):
+                    raise ValueError('Invalid tile GID: %s' % old_gid)
+                tileset_tile = previous_tilesets[index][number]
                 try:
-                    gid_map[tile.gid] = tileset_tile.gid(self.map)
+                    new_gid = tileset_tile.gid(self.map)
                 except helpers.TilesetNotInMapError:
                     msg = 'Cannot remove %s: map contains its tiles'
                     raise helpers.UsedTilesetError(msg % tileset_tile.tileset)
-        for tile in self.map.all_tiles():
-            if tile:
-                tile.gid = gid_map[tile.gid]
+                gid_map[old_gid] = new_gid
+            value_map[value] = (value & ~gid_mask) | new_gid
 
+        for layer in tile_layers:
+            layer._translate_values(value_map)
+        for obj in tile_objects:
+            obj.value = value_map[obj.value]
 
-class TilesetTile(object):
+
+class TilesetTile(helpers.SlotsPickleMixin):
     """Reference to a tile within a tileset
 
     init arguents, which become attributes:
@@ -118,6 +219,7 @@ class TilesetTile(object):
             The probability that this tile will be chosen among others with the
             same terrain information. May be None.
     """
+    __slots__ = ('tileset', 'number', '__weakref__')
     pixel_width, pixel_height = helpers.unpacked_properties('pixel_size')
 
     def __init__(self, tileset, number):
@@ -208,6 +310,8 @@ class TilesetTile(object):
 
 
 class GridTilesetTile(TilesetTile):
+    __slots__ = ()
+
     @property
     def pixel_size(self):
         return self.tileset.tile_size
@@ -287,16 +391,35 @@ class Tileset(fileio.ReadWriteBase):
     tile_class = TilesetTile
 
     tile_offset_x, tile_offset_y = helpers.unpacked_properties('tile_offset')
+    name = helpers.NameProperty()
 
     def __init__(self, name, tile_size):
         self.name = name
         self.tile_size = tile_size
         self.properties = {}
         self.terrains = terrain.TerrainList()
-        self.tiles = {}
+        self.tiles = weakref.WeakValueDictionary()
         self.tile_attributes = collections.defaultdict(dict)
         self.tile_offset = 0, 0
 
+    def __getstate__(self):
+        # TilesetTiles hold no state of their own; don't pickle the cache
+        state = dict(self.__dict__)
+        del state['tiles']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.tiles = weakref.WeakValueDictionary()
+
+    def _length_changed(self):
+        """Discard GID indexes that depend on the number of tiles in this set
+
+        Must be called whenever the length of the tileset changes.
+        """
+        for tileset_list in _gid_index_lists.pop(self):
+            tileset_list._gid_index = None
+
     def __getitem__(self, n):
         """Get tileset tile with the given number.
 
@@ -327,6 +450,8 @@ class Tileset(fileio.ReadWriteBase):
     def first_gid(self, map):
         """Return the first gid used by this tileset in the given map
         """
+        if isinstance(map.tilesets, TilesetList):
+            return map.tilesets.first_gid(self)
         num = 1
         for tileset in map.tilesets:
             if tileset is self:
@@ -489,10 +614,21 @@ class ImageTileset(Tileset):
 
             Number of rows of tiles in the tileset
 
+        .. attribute:: tile_image_cache_size
+
+            The maximum number of tile images (regions of `image`) the
+            tileset keeps for reuse. The cache is emptied when `image`,
+            `margin`, `spacing` or `tile_size` change.
+            Set it to 0 to disable the cache.
+            Can be set on the class or on individual tilesets.
+
     """
     type = 'image'
     tile_class = GridTilesetTile
 
+    # Maximum number of tile images kept by each tileset
+    tile_image_cache_size = 4096
+
     def __init__(self, name, tile_size, image, margin=0, spacing=0,
             source=None, base_path=None):
         super(ImageTileset, self).__init__(name, tile_size)
@@ -502,6 +638,47 @@ class ImageTileset(Tileset):
         self.spacing = spacing
         self.base_path = base_path
 
+    def __getstate__(self):
+        state = super(ImageTileset, self).__getstate__()
+        for name in '_recent_tile_images', '_old_tile_images', '_columns':
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        super(ImageTileset, self).__setstate__(state)
+        self._clear_tile_images()
+
+    def _clear_tile_images(self):
+        """Forget cached tile images, e.g. after the tile geometry changed
+
+        The cache has two generations: recently used images, and ones that
+        were used before the recent generation filled up.
+        """
+        self._recent_tile_images = {}
+        self._old_tile_images = {}
+        self._columns = None
+
+    def _geometry_property(name):
+        """Attribute whose change invalidates the cached tile images"""
+        attr_name = '_' + name
+
+        def getter(self):
+            return getattr(self, attr_name)
+
+        def setter(self, value):
+            setattr(self, attr_name, value)
+            self._clear_tile_images()
+            self._length_changed()
+
+        return property(getter, setter)
+
+    image = _geometry_property('image')
+    margin = _geometry_property('margin')
+    spacing = _geometry_property('spacing')
+    tile_size = _geometry_property('tile_size')
+
+    del _geometry_property
+
     def __len__(self):
         return self.column_count * self.row_count
 
@@ -514,7 +691,9 @@ class ImageTileset(Tileset):
     @property
     def column_count(self):
         """Number of columns in the tileset"""
-        return self._count(0)
+        if self._columns is None:
+            self._columns = self._count(0)
+        return self._columns
 
     @property
     def row_count(self):
@@ -522,12 +701,35 @@ class ImageTileset(Tileset):
         return self._count(1)
 
     def tile_image(self, number):
-        """Return the image used by the given tile"""
-        y, x = divmod(number, self.column_count)
-        left = self.margin + x * (self.tile_width + self.spacing)
-        top = self.margin + y * (self.tile_height + self.spacing)
-        return self.image[left:left + self.tile_width,
-                          top:top + self.tile_height]
+        """Return the image used by the given tile
+
+        The returned regions are cached. At most ``tile_image_cache_size``
+        of them are kept; the least recently used are dropped first.
+        Each of the two cache generations holds up to half of them, rounded
+        down.
+        """
+        recent = self._recent_tile_images
+        try:
+            return recent[number]
+        except KeyError:
+            pass
+        try:
+            region = self._old_tile_images.pop(number)
+        except KeyError:
+            y, x = divmod(number, self.column_count)
+            left = self.margin + x * (self.tile_width + self.spacing)
+            top = self.margin + y * (self.tile_height + self.spacing)
+            region = self.image[left:left + self.tile_width,
+                                top:top + self.tile_height]
+        generation_size = self.tile_image_cache_size // 2
+        if not generation_size:
+            return region
+        if len(recent) >= generation_size:
+            # Recent generation is full; it becomes the old one
+            self._old_tile_images = recent
+            recent = self._recent_tile_images = {}
+        recent[number] = region
+        return region
 
     def to_dict(self, **kwargs):
         """Export to a dict compatible with Tiled's JSON plugin"""
@@ -587,6 +789,10 @@ class IndividualTileTileset(Tileset):
         .. attribute:: spacing
 
             Space between adjacent tiles, in pixels.
+
+    The tile images are kept in the ``images`` list. Add new ones with
+    :meth:`append_image` rather than by changing the list directly, so that
+    maps using the tileset notice the new tiles.
     """
     type = 'individual'
 
@@ -599,9 +805,12 @@ class IndividualTileTileset(Tileset):
 
     def _append_placeholder(self):
         self.images.append(None)
+        self._length_changed()
 
     def append_image(self, image):
+        """Add a tile with the given image to the end of the tileset"""
         self.images.append(image)
+        self._length_changed()
 
     def tile_image(self, number):
         return self.images[number]
@@ -30,6 +30,39 @@ def desert():
     return tmxlib.Map.open(get_test_filename('desert.tmx'))
 
 
+@pytest.fixture
+def numpy():
+    """Return the numpy module, or skip test if unavailable"""
+    try:
+        import numpy
+    except ImportError:
+        raise pytest.skip('NumPy not available')
+    return numpy
+
+
+@pytest.fixture(params=['array', 'compact', 'numpy'])
+def storage(request):
+    if request.param == 'numpy':
+        # Skip when NumPy is unavailable
+        request.getfuncargvalue('numpy')
+    return request.param
+
+
+@pytest.fixture(params=[True, False])
+def use_numpy(request, storage, monkeypatch):
+    """Run layer operations with and without NumPy, for each storage
+
+    Without NumPy, tile layers fall back to pure-Python code paths.
+    """
+    if request.param:
+        request.getfuncargvalue('numpy')
+    elif storage == 'numpy':
+        raise pytest.skip('numpy storage needs NumPy')
+    else:
+        monkeypatch.setattr(tmxlib.layer, 'numpy', None)
+    return request.param
+
+
 def assert_xml_compare(a, b):
     report = []
 
@@ -54,6 +54,75 @@ def test_empty_named_elem_list():
         lst['k']
 
 
+class RenamableItem(object):
+    name = helpers.NameProperty()
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '<%s>' % self.name
+
+
+def test_named_elem_list_index():
+    def check(lst):
+        for name in 'abcdefgxyz':
+            expected = [i for i in lst if i.name == name][:1]
+            assert [lst.get(name)] == (expected or [None])
+            assert (name in lst) == bool(expected)
+
+    lst = helpers.NamedElementList(RenamableItem(x) for x in 'abcab')
+    check(lst)
+    lst.append(RenamableItem('d'))
+    lst.append(RenamableItem('a'))
+    check(lst)
+    lst[0] = RenamableItem('e')
+    check(lst)
+    lst['c'] = RenamableItem('f')
+    check(lst)
+    lst[-1] = RenamableItem('b')
+    check(lst)
+    lst.insert(1, RenamableItem('g'))
+    check(lst)
+    del lst['g']
+    check(lst)
+    lst.pop()
+    check(lst)
+    lst.move(0, 3)
+    check(lst)
+    lst[1:3] = [RenamableItem('g')]
+    check(lst)
+    lst.reverse()
+    check(lst)
+
+    # Renaming elements in the list
+    lst[-1].name = 'z'
+    check(lst)
+    lst[0].name = 'a'
+    check(lst)
+    lst['a'].name = 'b'
+    check(lst)
+
+    # Renaming elements of other lists keeps the index
+    other = helpers.NamedElementList([RenamableItem('x'), lst[0]])
+    check(other)
+    index = lst._get_name_index()
+    other[0].name = 'y'
+    assert lst._get_name_index() is index
+    check(other)
+    # ... unless they're in both lists
+    other[1].name = 'c'
+    check(lst)
+    check(other)
+
+    # Failed modifications leave a valid index
+    with pytest.raises(ZeroDivisionError):
+        with lst.modification_context():
+            lst.append(RenamableItem('c'))
+            1 / 0
+    check(lst)
+
+
 def test_assert_item():
     dct = {'key': 'value', 'key2': 'bad value'}
     helpers.assert_item(dct, 'key', 'value')
@@ -428,6 +428,159 @@ def test_canvas_init_commands(canvas_mod, commands_4cc):
     assert_png_repr_equal(canvas, 'colorcorners-x4.png')
 
 
+def test_canvas_draw_batch(canvas_mod, commands_4cc):
+    commands = list(tmxlib.draw.batch_commands(commands_4cc))
+    assert len(commands) == 1
+    assert [pos for image, pos, flags in commands[0].items] == [
+        (0, 0), (16, 0), (0, 16), (16, 16)]
+    canvas = canvas_mod.Canvas((32, 32), commands=commands)
+    assert_png_repr_equal(canvas, 'colorcorners-x4.png')
+
+
+def test_batch_commands_opacity(colorcorners_image):
+    commands = list(tmxlib.draw.batch_commands([
+        tmxlib.draw.DrawImageCommand(colorcorners_image),
+        tmxlib.draw.DrawImageCommand(colorcorners_image, (16, 0)),
+        tmxlib.draw.DrawImageCommand(colorcorners_image, opacity=0.5),
+        tmxlib.draw.DrawCommand(),
+        tmxlib.draw.DrawImageCommand(colorcorners_image, opacity=0.5),
+    ]))
+    assert [type(c).__name__ for c in commands] == [
+        'DrawImageBatchCommand', 'DrawImageBatchCommand', 'DrawCommand',
+        'DrawImageBatchCommand']
+    assert [len(c.items) for c in commands if hasattr(c, 'items')] == [
+        2, 1, 1]
+    assert [c.opacity for c in commands if hasattr(c, 'items')] == [
+        1, 0.5, 0.5]
+
+
+def test_canvas_draw_batch_alpha(image_class, colorcorners_image, canvas_mod):
+    # Non-overlapping images drawn in a batch look the same as when drawn
+    # individually
+    scribble = load_image(image_class, 'scribble.png')
+    items = [(scribble, (0, 0), 0), (colorcorners_image, (32, 0), 0)]
+    batched = canvas_mod.Canvas((48, 32))
+    batched.draw_images(items, opacity=0.5)
+    single = canvas_mod.Canvas((48, 32))
+    for image, pos, flags in items:
+        single.draw_image(image, pos, opacity=0.5)
+    assert_pil_images_equal(batched.pil_image, single.pil_image, epsilon=1)
+
+
+def test_canvas_source_not_cached(canvas_mod, colorcorners_image):
+    source = canvas_mod.Canvas((16, 16))
+    # Regions of a canvas normally refer to an immutable copy of it;
+    # make one that refers to the canvas itself
+    region = source[8:16, 0:8]
+    region.parent = source
+    target = canvas_mod.Canvas((8, 8))
+    target.draw_image(region)
+    assert target.pil_image.getbbox() is None
+
+    # Changes to the canvas show up in later drawings
+    source.draw_image(colorcorners_image)
+    target.draw_image(region)
+    assert_pil_images_equal(target.pil_image,
+                            source.pil_image.crop((8, 0, 16, 8)))
+
+    # ... including flipped drawings
+    from PIL import Image
+    flipped = canvas_mod.Canvas((8, 8))
+    flipped.draw_image(region, flags=0x80000000)
+    source.draw_image(colorcorners_image, (-8, 0))
+    flipped.draw_image(region, flags=0x80000000)
+    assert_pil_images_equal(
+        flipped.pil_image,
+        source.pil_image.crop((8, 0, 16, 8)).transpose(Image.FLIP_LEFT_RIGHT))
+    assert target._pil_cache == flipped._pil_cache == {}
+
+
+def test_render_flipped_tiles(canvas_mod):
+    map = tmxlib.Map.open(get_test_filename('flip-test.tmx'))
+    layer = map.layers[0]
+    assert layer[1, 0].flags == 0xA0000000
+    commands = list(layer.generate_draw_commands())
+    assert [c.flags for c in commands] == [
+        t.flags for t in layer.all_tiles() if t]
+
+    # Each transformed tile is made once per canvas
+    canvas = canvas_mod.Canvas(map.pixel_size)
+    for command in commands + commands:
+        command.draw(canvas)
+    assert len(canvas._pil_cache) == len(set(c.flags for c in commands))
+    assert_png_repr_equal(canvas, 'flip-test.rendered.png')
+
+
+def test_render_viewport(canvas_mod, filename, rendered_filename):
+    map = tmxlib.Map.open(get_test_filename(filename))
+    for obj in map.all_objects():
+        if not obj.value:
+            raise pytest.skip('Plain objects not renderable yet')  # TODO
+    full = map.render().pil_image
+    for rect in [(0, 0, 40, 30), (17, 35, 64, 50), (100, 90, 33, 47),
+                 (-20, -10, 50, 40), (150, 200, 500, 500)]:
+        viewport = map.render(rect=rect)
+        x, y, width, height = rect
+        assert viewport.size == (width, height)
+        assert_pil_images_equal(viewport.pil_image,
+                                full.crop((x, y, x + width, y + height)))
+
+
+def test_render_tile_viewport(canvas_mod):
+    map = tmxlib.Map.open(get_test_filename('desert.tmx'))
+    viewport = map.render(tile_rect=(2, 3, 4, 5))
+    assert viewport.size == (128, 160)
+    assert_pil_images_equal(viewport.pil_image,
+                            map.render(rect=(64, 96, 128, 160)).pil_image)
+    with pytest.raises(TypeError):
+        map.render(rect=(0, 0, 1, 1), tile_rect=(0, 0, 1, 1))
+
+    # Only tiles in the viewport are visited
+    layer = map.layers[0]
+    commands = list(layer.generate_draw_commands((64, 96, 128, 160)))
+    assert len(commands) == 4 * 5
+    assert list(layer.generate_draw_commands((-100, -100, 50, 50))) == []
+
+
+def test_render_pyramid(canvas_mod, tmpdir):
+    from tmxlib import pyramid
+    map = tmxlib.Map.open(get_test_filename('desert.tmx'))
+    # Leave the bottom right corner empty
+    map.layers[0].fill((20, 20, 20, 20), 0)
+    assert pyramid.max_zoom(map, 320) == 2
+    assert pyramid.max_zoom(map, 1280) == 0
+    assert pyramid.max_zoom(map, 2000) == 0
+
+    written = map.render_pyramid(str(tmpdir), tile_size=320)
+    expected = set([(2, x, y) for x in range(4) for y in range(4)] +
+                   [(1, x, y) for x in range(2) for y in range(2)] +
+                   [(0, 0, 0)])
+    expected -= set([(2, 2, 2), (2, 3, 2), (2, 2, 3), (2, 3, 3), (1, 1, 1)])
+    assert set(written) == expected
+    assert len(written) == len(expected)
+    for z, x, y in expected:
+        assert tmpdir.join(str(z), str(x), '%s.png' % y).check()
+    assert not tmpdir.join('2', '3', '3.png').check()
+
+    full = map.render().pil_image
+    tile = pil_image_open(str(tmpdir.join('2', '1', '2.png')))
+    assert tile.size == (320, 320)
+    assert_pil_images_equal(tile, full.crop((320, 640, 640, 960)))
+    tile = pil_image_open(str(tmpdir.join('0', '0', '0.png')))
+    assert tile.size == (320, 320)
+    # Downsampling twice gives about the same as resizing the whole map
+    # (compared with premultiplied alpha, so nearly transparent pixels can't
+    # differ much)
+    from PIL import ImageChops
+    resized = full.convert('RGBa').resize((320, 320), pyramid._RESAMPLE)
+    difference = ImageChops.difference(tile.convert('RGBa'), resized)
+    assert max(band.getextrema()[1] for band in difference.split()) < 32
+
+    written = map.render_pyramid(str(tmpdir.join('min')), tile_size=320,
+                                 min_zoom=2)
+    assert set(written) == set(t for t in expected if t[0] == 2)
+
+
 def test_render_layer(canvas_mod):
     commands = []
     desert = tmxlib.Map.open(get_test_filename('desert.tmx'))
@@ -2,13 +2,22 @@
 from __future__ import division
 
 import os
+import io
 import sys
+import gzip
+import zlib
+import array
+import base64
+import struct
+import random
 import tempfile
 import json
 
 import pytest
 
 import tmxlib
+from tmxlib.fileio import etree
+from tmxlib.compatibility import ord_
 from tmxlib_test import get_test_filename, file_contents, base_path
 from tmxlib_test import assert_xml_compare
 
@@ -25,6 +34,7 @@ test_map_infos = {
     'imagelayer.tmx': {},
     'objects.tmx': {},
     'perspective_walls_individual.tmx': {},
+    'flip-test.tmx': {},
 
     # NOTE: the image for this map's tileset is intentionally missing
     'isometric_grass_and_water.tmx': {'loadable': False},
@@ -36,6 +46,18 @@ def filename(request):
     return request.param
 
 
+@pytest.fixture(params=['array', 'compact', 'numpy'])
+def layer_storage(request, monkeypatch):
+    monkeypatch.setattr(tmxlib.TileLayer, 'default_storage', request.param)
+    return request.param
+
+
+@pytest.fixture(params=['objects', 'columns'])
+def object_storage(request, monkeypatch):
+    monkeypatch.setattr(tmxlib.ObjectLayer, 'default_storage', request.param)
+    return request.param
+
+
 @pytest.fixture
 def has_gzip(filename):
     return test_map_infos[filename].get('has_gzip', False)
@@ -123,7 +145,8 @@ def test_roundtrip_opensave(filename, has_gzip, out_filename):
         os.unlink(temporary_file.name)
 
 
-def test_roundtrip_readwrite(filename, has_gzip, out_filename):
+def test_roundtrip_readwrite(filename, has_gzip, out_filename, layer_storage,
+                             object_storage):
     if has_gzip and sys.version_info < (2, 7):
         raise pytest.skip('Cannot test gzip on Python 2.6: missing mtime arg')
 
@@ -138,6 +161,250 @@ def test_roundtrip_readwrite(filename, has_gzip, out_filename):
     assert_xml_compare(xml, dumped)
 
 
+def test_roundtrip_fileobj(filename, has_gzip, out_filename):
+    if has_gzip and sys.version_info < (2, 7):
+        raise pytest.skip('Cannot test gzip on Python 2.6: missing mtime arg')
+
+    roots = []
+
+    class RecordingSerializer(tmxlib.fileio.TMXSerializer):
+        def _new_map(self, cls, root, base_path):
+            roots.append(root)
+            return super(RecordingSerializer, self)._new_map(
+                    cls, root, base_path)
+
+    with open(get_test_filename(filename), 'rb') as fileobj:
+        map = tmxlib.Map.open(fileobj, serializer=RecordingSerializer())
+    assert map.base_path == base_path
+    # Elements are discarded as soon as they are read
+    [root] = roots
+    assert len(root) == 0
+    for layer in map.layers:
+        # normalize mtime, for Gzip
+        layer.mtime = 0
+    assert_xml_compare(file_contents(get_test_filename(out_filename)),
+                       map.dump())
+
+
+def test_lazy_layers(filename, has_gzip, out_filename):
+    xml = file_contents(get_test_filename(filename))
+    map = tmxlib.Map.load(xml, base_path=base_path, lazy_layers=True)
+    for layer in map.layers:
+        if layer.type == 'tiles':
+            assert layer.encoded_data is not None
+    # Undecoded data is written out verbatim, including gzip mtime
+    assert_xml_compare(file_contents(get_test_filename(out_filename)),
+                       map.dump())
+
+    eager_map = tmxlib.Map.load(xml, base_path=base_path)
+    for layer, eager_layer in zip(map.layers, eager_map.layers):
+        if layer.type == 'tiles':
+            assert layer.data.tolist() == eager_layer.data.tolist()
+            assert layer.encoded_data is None
+            assert ([t.value for t in layer.all_tiles()] ==
+                    [t.value for t in eager_layer.all_tiles()])
+
+
+def test_lazy_layer_reencode():
+    xml = file_contents(get_test_filename('desert.tmx'))
+    map = tmxlib.Map.load(xml, base_path=base_path, lazy_layers=True)
+    layer = map.layers[0]
+    layer.compression = None
+    layer.encoding = 'base64'
+    map = tmxlib.Map.load(map.dump(), base_path=base_path)
+    assert map.layers[0].compression is None
+    assert map.layers[0][1, 2].value == 30
+
+    map = tmxlib.Map.load(xml, base_path=base_path, lazy_layers=True)
+    with pytest.raises(ValueError):
+        tmxlib.TileLayer(map, 'bad', data=map.layers[0].data,
+                         encoded_data=('', 'base64', None))
+    map.layers[0][1, 2] = 1
+    map = tmxlib.Map.load(map.dump(), base_path=base_path)
+    assert map.layers[0][1, 2].value == 1
+
+
+def test_zstd_compression(layer_storage):
+    zstandard = pytest.importorskip('zstandard')
+    xml = file_contents(get_test_filename('desert.tmx'))
+    map = tmxlib.Map.load(xml, base_path=base_path)
+    layer = map.layers[0]
+    layer.compression = 'zstd'
+    dumped = map.dump()
+    assert b'compression="zstd"' in dumped
+
+    new_map = tmxlib.Map.load(dumped, base_path=base_path)
+    assert new_map.layers[0].compression == 'zstd'
+    assert new_map.layers[0].data.tolist() == layer.data.tolist()
+
+    # Streamed zstd frames do not record the content size
+    values = layer.data.tolist()
+    data = struct.pack('<%sI' % len(values), *values)
+    compressor = zstandard.ZstdCompressor().compressobj()
+    compressed = compressor.compress(data) + compressor.flush()
+    text = base64.b64encode(compressed).decode('ascii')
+    assert map.serializer.decode_tile_data(
+        text, 'base64', 'zstd', layer_storage).tolist() == values
+
+
+max_levels = {'zlib': 9, 'gzip': 9, 'zstd': 19}
+
+
+@pytest.mark.parametrize('compression', sorted(max_levels))
+def test_compression_levels(compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    serializer = tmxlib.fileio.TMXSerializer()
+    fast_serializer = tmxlib.fileio.TMXSerializer(
+        compression_levels={compression: 1})
+    small_serializer = tmxlib.fileio.TMXSerializer()
+    small_serializer.compression_levels[compression] = max_levels[
+        compression]
+
+    rand = random.Random(0)
+    map = tmxlib.Map((128, 128), (32, 32))
+    layer = map.add_layer('Ground')
+    layer.data = [rand.choice((1, 2, 3, 30)) for i in range(128 * 128)]
+    layer.compression = compression
+    layer.mtime = 0
+    dumps = [map.dump(s) for s in
+             (serializer, fast_serializer, small_serializer)]
+    assert len(dumps[1]) > len(dumps[2])
+    for dumped in dumps:
+        new_map = tmxlib.Map.load(dumped)
+        assert new_map.layers[0].data.tolist() == layer.data.tolist()
+
+
+small_map_template = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.0" orientation="orthogonal" width="3" height="2"
+        tilewidth="32" tileheight="32">
+ <layer name="Ground" width="3" height="2">
+  %s
+ </layer>
+</map>
+"""
+
+
+@pytest.mark.parametrize('data_xml', [
+    """<data encoding="csv">
+1,2,3,
+0,2147483649,4
+</data>""",
+    """<data>
+   <tile gid="1"/><tile gid="2"/><tile gid="3"/>
+   <tile/><tile gid="2147483649"/><tile gid="4"/>
+  </data>""",
+])
+def test_text_encodings(data_xml, layer_storage):
+    map = tmxlib.Map.load(small_map_template % data_xml)
+    layer = map.layers[0]
+    assert layer.compression is None
+    assert layer.data.tolist() == [1, 2, 3, 0, 0x80000001, 4]
+    assert layer[1, 1].flipped_horizontally
+
+    # Layers are saved with the encoding they were loaded with
+    map = tmxlib.Map.load(map.dump())
+    assert map.layers[0].encoding == layer.encoding
+    assert map.layers[0].data.tolist() == layer.data.tolist()
+
+
+@pytest.mark.parametrize('encoding', ['csv', None])
+def test_text_encoding_roundtrip(encoding, layer_storage):
+    xml = file_contents(get_test_filename('desert.tmx'))
+    map = tmxlib.Map.load(xml, base_path=base_path)
+    layer = map.layers[0]
+    layer.encoding = encoding
+    layer.compression = None
+    dumped = map.dump()
+
+    data_elem = etree.XML(dumped).find('layer/data')
+    if encoding == 'csv':
+        lines = data_elem.text.strip().split('\n')
+        assert len(lines) == map.height
+        assert lines[0].split(',')[:3] == ['30', '30', '30']
+    else:
+        assert len(data_elem) == map.width * map.height
+        assert data_elem[0].attrib['gid'] == '30'
+
+    new_map = tmxlib.Map.load(dumped, base_path=base_path)
+    assert new_map.layers[0].encoding == encoding
+    assert new_map.layers[0].data.tolist() == layer.data.tolist()
+
+
+def test_text_encoding_compression():
+    with pytest.raises(ValueError):
+        tmxlib.Map.load(small_map_template %
+            '<data encoding="csv" compression="zlib">1,2,3,4,5,6</data>')
+    map = tmxlib.Map.load(small_map_template %
+            '<data encoding="csv">1,2,3,4,5,6</data>')
+    map.layers[0].compression = 'zlib'
+    map.layers[0].data
+    with pytest.raises(ValueError):
+        map.dump()
+
+
+@pytest.mark.skipif(not os.environ.get('PYTMXLIB_TEST_BENCHMARK'),
+                    reason='Set PYTMXLIB_TEST_BENCHMARK=yes to run benchmarks')
+@pytest.mark.parametrize(('encoding', 'compression'), [
+    ('base64', 'zlib'), ('base64', 'zstd'), ('csv', None), (None, None)])
+def test_encoding_benchmark(encoding, compression, layer_storage):
+    import timeit
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    size = 256
+    map = tmxlib.Map((size, size), (32, 32))
+    layer = map.add_layer('Ground')
+    layer.data = [i % 1000 for i in range(size * size)]
+    layer.encoding = encoding
+    layer.compression = compression
+    xml = map.dump()
+
+    def load():
+        return tmxlib.Map.load(xml).layers[0]
+
+    assert load().data.tolist() == layer.data.tolist()
+    load_time = min(timeit.repeat(load, number=1, repeat=5))
+    dump_time = min(timeit.repeat(map.dump, number=1, repeat=5))
+    print('%s/%s (%s): load %.2f ms, dump %.2f ms, %s bytes' % (
+        encoding, compression, layer_storage,
+        load_time * 1000, dump_time * 1000, len(xml)))
+
+
+@pytest.mark.skipif(not os.environ.get('PYTMXLIB_TEST_BENCHMARK'),
+                    reason='Set PYTMXLIB_TEST_BENCHMARK=yes to run benchmarks')
+def test_object_storage_benchmark(object_storage):
+    import timeit
+    count = 200000
+    map = tmxlib.Map.load(file_contents(get_test_filename('desert.tmx')),
+                          base_path=base_path)
+    layer = map.add_object_layer('Objects')
+    layer[:] = [
+        tmxlib.RectangleObject(layer, (i % 1000, i // 1000), (1, 1),
+                               name='Spawn %s' % i, type='spawn')
+        for i in range(count)]
+    xml = map.dump()
+
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    else:
+        tracemalloc.start()
+    start = timeit.default_timer()
+    map = tmxlib.Map.load(xml, base_path=base_path)
+    load_time = timeit.default_timer() - start
+    if tracemalloc:
+        memory = '%.1f MiB' % (tracemalloc.get_traced_memory()[0] / 2 ** 20)
+        tracemalloc.stop()
+    else:
+        memory = 'unknown'
+    assert len(map.layers['Objects']) == count
+
+    dump_time = min(timeit.repeat(map.dump, number=1, repeat=3))
+    print('%s objects (%s): load %.2f s, dump %.2f s, memory %s' % (
+        count, object_storage, load_time, dump_time, memory))
+
+
 def test_dict_export(filename):
     xml = file_contents(get_test_filename(filename))
     map = tmxlib.Map.load(xml, base_path=base_path)
@@ -146,7 +413,8 @@ def test_dict_export(filename):
     assert_json_safe_almost_equal(result, dct)
 
 
-def test_dict_import(filename, has_gzip, out_filename, map_loadable):
+def test_dict_import(filename, has_gzip, out_filename, map_loadable,
+                     object_storage):
     dct = json.load(open(get_test_filename(filename.replace('.tmx', '.json'))))
     map = tmxlib.Map.from_dict(dct, base_path=base_path)
 
@@ -179,3 +447,64 @@ def test_dict_import(filename, has_gzip, out_filename, map_loadable):
 
     dumped = map.dump()
     assert_xml_compare(xml, dumped)
+
+
+def reference_layer_data(data_elem):
+    """Decode a <data> element value by value, without any bulk tricks"""
+    data = base64.b64decode(data_elem.text.encode('ascii'))
+    compression = data_elem.attrib.get('compression')
+    if compression == 'zlib':
+        data = zlib.decompress(data)
+    elif compression == 'gzip':
+        data = gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+    return [
+        ord_(a) + (ord_(b) << 8) + (ord_(c) << 16) + (ord_(d) << 24)
+        for a, b, c, d in zip(*(data[x::4] for x in range(4)))]
+
+
+def test_layer_data_decoding(filename, layer_storage):
+    xml = file_contents(get_test_filename(filename))
+    map = tmxlib.Map.load(xml, base_path=base_path)
+    tree = etree.XML(xml)
+    for elem in tree.findall('layer'):
+        layer = map.layers[elem.attrib['name']]
+        expected = reference_layer_data(elem.find('data'))
+        assert layer.storage == layer_storage
+        assert layer.data.tolist() == expected
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_gids_from_bytes(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(tmxlib.fileio, 'numpy', None)
+    data = b'\x01\x00\x00\x00\xff\xff\xff\x0f\x05\x00\x00\xe0\x00\x00\x00\x00'
+    result = tmxlib.fileio.gids_from_bytes(data)
+    assert list(result) == [1, 0x0FFFFFFF, 0xE0000005, 0]
+    with pytest.raises(ValueError):
+        tmxlib.fileio.gids_from_bytes(data[:-1])
+
+
+@pytest.mark.parametrize('convert', [
+    lambda storage: tmxlib.fileio.gids_from_bytes(b'', storage),
+    lambda storage: tmxlib.fileio.gids_from_strings([], storage),
+])
+def test_gids_numpy_storage_without_numpy(monkeypatch, convert):
+    monkeypatch.setattr(tmxlib.fileio, 'numpy', None)
+    with pytest.raises(ImportError):
+        convert('numpy')
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+@pytest.mark.parametrize('container', [
+    list,
+    lambda values: array.array('L', values),
+    lambda values: array.array(tmxlib.fileio.GID_TYPECODE, values),
+])
+def test_gids_to_bytes(monkeypatch, use_numpy, container):
+    if not use_numpy:
+        monkeypatch.setattr(tmxlib.fileio, 'numpy', None)
+    values = [1, 0x0FFFFFFF, 0xE0000005, 0]
+    result = tmxlib.fileio.gids_to_bytes(container(values))
+    assert bytes(bytearray(result)) == (
+        b'\x01\x00\x00\x00\xff\xff\xff\x0f\x05\x00\x00\xe0\x00\x00\x00\x00')
+    assert list(tmxlib.fileio.gids_from_bytes(result)) == values
@@ -2,11 +2,15 @@
 from __future__ import division
 
 import os
+import sys
+import pickle
+import collections
 
 import pytest
 
 import tmxlib
-from tmxlib_test import desert, get_test_filename, file_contents
+from tmxlib_test import desert, get_test_filename, file_contents, base_path
+from tmxlib_test import numpy, storage, use_numpy
 from tmxlib_test import assert_xml_compare
 
 
@@ -397,6 +401,105 @@ def test_remove_used_tileset():
         del map.tilesets[0]
 
 
+def test_first_gid_cache(monkeypatch):
+    map = tmxlib.Map.open(get_test_filename('desert_and_walls.tmx'))
+    desert, walls = map.tilesets
+    walls2 = tmxlib.ImageTileset('Walls2', tile_size=(20, 20),
+        image=desert.image)
+    map.tilesets.append(walls2)
+    assert walls2.first_gid(map) == 65
+
+    len_calls = []
+    original_len = tmxlib.ImageTileset.__len__
+    def counting_len(self):
+        len_calls.append(self)
+        return original_len(self)
+    monkeypatch.setattr(tmxlib.ImageTileset, '__len__', counting_len)
+
+    assert walls2.first_gid(map) == 65
+    assert walls.first_gid(map) == 49
+    assert len_calls == []
+    assert map.end_gid == 182
+    assert len_calls == [walls2]
+
+    # Changes to the list invalidate the cache
+    map.tilesets.move('Walls2', -1)
+    assert walls2.first_gid(map) == 49
+    assert walls.first_gid(map) == 49 + len(walls2)
+
+    # ... including changes that are rolled back
+    with pytest.raises(tmxlib.UsedTilesetError):
+        with map.tilesets.modification_context():
+            del map.tilesets['Walls2']
+            assert walls.first_gid(map) == 49
+            del map.tilesets['Desert']
+    assert walls2.first_gid(map) == 49
+    assert walls.first_gid(map) == 49 + len(walls2)
+
+    with pytest.raises(tmxlib.TilesetNotInMapError):
+        tmxlib.ImageTileset('Other', tile_size=(20, 20),
+                            image=desert.image).first_gid(map)
+
+
+def test_first_gid_after_tileset_grows():
+    map = tmxlib.Map((4, 4), (32, 32))
+    image = tmxlib.image.open(get_test_filename('tmw_desert_spacing.png'))
+    first = tmxlib.IndividualTileTileset('First', (32, 32))
+    second = tmxlib.IndividualTileTileset('Second', (32, 32))
+    for tileset in first, second:
+        tileset.append_image(image)
+        map.tilesets.append(tileset)
+    assert (second.first_gid(map), second.end_gid(map)) == (2, 3)
+
+    # Growing a tileset after the GID index is built renumbers later ones
+    first.append_image(image)
+    first.append_image(image)
+    assert (second.first_gid(map), second.end_gid(map)) == (4, 5)
+    assert map.end_gid == 5
+    layer = map.add_layer('Ground')
+    layer[0, 0] = 4
+    with pytest.raises(ValueError):
+        layer[0, 1] = 5
+
+    # So does changing the tile grid of an image tileset
+    desert = tmxlib.ImageTileset('Desert', (32, 32), image, 1, 1)
+    map.tilesets.insert(0, desert)
+    assert first.first_gid(map) == 49
+    desert.tile_size = 64, 64
+    assert first.first_gid(map) == 13
+
+
+@pytest.mark.parametrize('filename', ['desert_and_walls.tmx',
+                                      'perspective_walls_individual.tmx'])
+def test_gid_index(filename):
+    map = tmxlib.Map.open(get_test_filename(filename))
+    map.tilesets.append(tmxlib.IndividualTileTileset('Empty', (32, 32)))
+    for tile in map.all_tiles():
+        expected = tile._tileset_tile(list(map.tilesets))
+        assert tile.tileset_tile == expected
+    for gid in range(1, map.end_gid):
+        tile = map.tilesets.tileset_tile(gid)
+        assert tile.gid(map) == gid
+    for gid in (0, -1, map.end_gid, map.end_gid + 1):
+        with pytest.raises(ValueError):
+            map.tilesets.tileset_tile(gid)
+
+    # The index follows changes to the tileset list
+    last_tile = map.tilesets.tileset_tile(map.end_gid - 1)
+    map.tilesets.move(-1, -len(map.tilesets))
+    map.tilesets.move(-1, -len(map.tilesets))
+    assert map.tilesets.tileset_tile(1).tileset is last_tile.tileset
+    assert map.tilesets.tileset_tile(last_tile.number + 1) == last_tile
+
+    # ... and changes to the number of tiles in a tileset
+    empty = map.tilesets['Empty']
+    empty.append_image(last_tile.image)
+    assert map.tilesets.tileset_tile(empty.first_gid(map)) == empty[0]
+    for tile in map.all_tiles():
+        expected = tile._tileset_tile(list(map.tilesets))
+        assert tile.tileset_tile == expected
+
+
 def test_objects():
     map = tmxlib.Map.open(get_test_filename('desert_and_walls.tmx'))
 
@@ -465,6 +568,18 @@ def test_shared_tilesets():
     assert map1.tilesets[0] is map2.tilesets[0]
 
 
+def test_shared_options():
+    filename = get_test_filename('desert.tmx')
+    map1 = tmxlib.Map.open(filename, shared=True)
+    map2 = tmxlib.Map.open(filename, shared=True)
+    lazy_map = tmxlib.Map.open(filename, shared=True, lazy_layers=True)
+
+    assert map1 is map2
+    assert lazy_map is not map1
+    assert lazy_map.layers[0].encoded_data is not None
+    assert map1.layers[0].encoded_data is None
+
+
 def test_autoadd_tileset(desert):
     tileset = tmxlib.ImageTileset.open(
             get_test_filename('perspective_walls.tsx'))
@@ -586,6 +701,383 @@ def test_del_tileset():
     assert_xml_compare(xml, dumped)
 
 
+def test_renumber_tilesets(storage, monkeypatch):
+    monkeypatch.setattr(tmxlib.TileLayer, 'default_storage', storage)
+    filename = get_test_filename('desert_and_walls.tmx')
+    map = tmxlib.Map.open(filename)
+    building = map.layers['Building']
+    original_values = building[1, 2].value, building[2, 2].value
+    building[1, 2] = map.tilesets['Walls'][3]
+    building[1, 2].vflip()
+    building[2, 2].hflip()
+    data = building.data
+
+    def tile_info():
+        return [(t.tileset, t.number, t.value & 0xF0000000)
+                for t in map.all_tiles()]
+    info = tile_info()
+    assert any(t.tileset is map.tilesets['Walls'] for t in map.all_objects())
+
+    map.tilesets.move('Walls', -1)
+    assert [t.name for t in map.tilesets] == ['Walls', 'Desert']
+    assert tile_info() == info
+    assert building.data is data
+    assert building[1, 2].flipped_vertically
+    assert building[2, 2].flipped_horizontally
+
+    map.tilesets.move('Walls', 1)
+    building[1, 2], building[2, 2] = original_values
+    assert_xml_compare(file_contents(filename), map.dump())
+
+
+def test_layer_content(desert, storage, use_numpy):
+    layer = tmxlib.TileLayer(desert, 'New layer', storage=storage)
+    assert not layer
+    assert layer.count_nonempty() == 0
+    assert layer.content_bbox() is None
+
+    # Flags alone do not make a tile non-empty
+    layer[3, 4] = 0x80000000
+    assert not layer
+    assert layer.count_nonempty() == 0
+    assert layer.content_bbox() is None
+
+    layer[5, 2] = 1
+    assert layer
+    assert layer.count_nonempty() == 1
+    assert layer.content_bbox() == (5, 2, 1, 1)
+
+    layer[1, 7] = 0x40000002
+    layer[2, 7] = 2
+    assert layer.count_nonempty() == 3
+    assert layer.content_bbox() == (1, 2, 5, 6)
+
+    layer[-1, -1] = 3
+    assert layer.count_nonempty() == 4
+    assert layer.content_bbox() == (1, 2, desert.width - 1,
+                                    desert.height - 2)
+
+    ground = desert.layers[0]
+    assert ground.count_nonempty() == sum(1 for t in ground.all_tiles() if t)
+    assert ground.content_bbox() == (0, 0, desert.width, desert.height)
+
+
+def test_layer_regions(desert, storage):
+    layer = tmxlib.TileLayer(desert, 'New layer', storage=storage)
+    layer.set_region(2, 3, [[1, 2, 3], [4, 5, 0x80000006]])
+    assert [[t.value for t in row] for row in (
+        (layer[2, 3], layer[3, 3], layer[4, 3]),
+        (layer[2, 4], layer[3, 4], layer[4, 4]))] == [
+            [1, 2, 3], [4, 5, 0x80000006]]
+    assert layer[1, 3].value == layer[5, 3].value == layer[2, 5].value == 0
+
+    region = layer.get_region(1, 3, 3, 2)
+    assert [row.tolist() for row in region] == [[0, 1, 2], [0, 4, 5]]
+    region[0][0] = 7
+    assert layer[1, 3].value == 0
+    layer.set_region(0, 0, region)
+    assert layer[0, 0].value == 7
+    assert layer.get_region(0, 0, 0, 0) == []
+
+    layer.fill((10, 11, 3, 4), 9)
+    assert layer.count_nonempty() == 6 + 5 + 12
+    assert layer.content_bbox() == (0, 0, 13, 15)
+    assert layer[12, 14].value == 9
+    layer.fill((10, 11, 3, 4), desert.tilesets[0][3])
+    assert layer[12, 14].gid == 4
+    layer.fill((10, 11, 3, 4), 0)
+
+    # Overlapping copy within a layer
+    layer.copy_region(layer, (2, 3, 3, 2), (3, 3))
+    assert [row.tolist() for row in layer.get_region(2, 3, 4, 2)] == [
+        [1, 1, 2, 3], [4, 4, 5, 0x80000006]]
+    ground = desert.layers[0]
+    layer.copy_region(ground, (0, 0, desert.width, desert.height), (0, 0))
+    assert layer.data.tolist() == ground.data.tolist()
+
+    before = layer.data.tolist()
+    with pytest.raises(ValueError):
+        layer.set_region(0, 0, [[1, 2], [3, desert.end_gid]])
+    with pytest.raises(ValueError):
+        layer.set_region(0, 0, [[1, 2], [3]])
+    # Values that don't fit in any storage are rejected the same way
+    for bad_value in -1, 0x100000000:
+        with pytest.raises(ValueError):
+            layer.set_region(0, 0, [[1, 2], [3, bad_value]])
+        with pytest.raises(ValueError):
+            layer.fill((0, 0, 2, 2), bad_value)
+    with pytest.raises(IndexError):
+        layer.set_region(desert.width - 1, 0, [[1, 2]])
+    with pytest.raises(IndexError):
+        layer.get_region(-1, 0, 2, 2)
+    with pytest.raises(IndexError):
+        layer.fill((0, desert.height - 1, 1, 2), 1)
+    assert layer.data.tolist() == before
+
+
+def test_layer_region_numpy(desert, numpy, storage):
+    layer = tmxlib.TileLayer(desert, 'New layer', storage=storage)
+    block = numpy.arange(1, 13, dtype=numpy.uint32).reshape(3, 4)
+    layer.set_region(1, 2, block)
+    assert (layer.as_array()[2:5, 1:5] == block).all()
+    assert numpy.array(layer.get_region(1, 2, 4, 3)).tolist() == (
+        block.tolist())
+    with pytest.raises(ValueError):
+        layer.set_region(1, 2, numpy.array([[1, -1]], dtype=numpy.int64))
+    assert (layer.as_array()[2:5, 1:5] == block).all()
+
+
+def test_layer_raw_iteration(storage, use_numpy, monkeypatch):
+    monkeypatch.setattr(tmxlib.TileLayer, 'default_storage', storage)
+    map = tmxlib.Map.open(get_test_filename('desert_and_walls.tmx'))
+    layer = map.layers['Building']
+    assert layer.storage == storage
+    layer[3, 1] = 0x80000000
+    layer[4, 1] = 0x40000003
+
+    tiles = list(layer.all_tiles())
+    assert list(layer.all_values()) == [(t.x, t.y, t.value) for t in tiles]
+    assert list(layer.all_gids()) == [
+        (t.x, t.y, t.gid, t.value & 0xF0000000) for t in tiles]
+    assert list(layer.nonzero_positions()) == [
+        (t.x, t.y) for t in tiles if t]
+    assert (4, 1) in layer.nonzero_positions()
+    assert (3, 1) not in layer.nonzero_positions()
+    map.check_consistency()
+
+
+def test_check_consistency(storage, use_numpy, monkeypatch):
+    monkeypatch.setattr(tmxlib.TileLayer, 'default_storage', storage)
+    map = tmxlib.Map.open(get_test_filename('desert_and_walls.tmx'))
+    assert map.check_consistency(report=True) == []
+    map.check_consistency()
+
+    end_gid = map.end_gid
+    building = map.layers['Building']
+    building.data[3] = end_gid
+    building.data[5 + map.width] = 0x80000000 | (end_gid + 1)
+    building.data[6 + map.width] = 0x80000000 | (end_gid - 1)
+    tile_object = next(map.layers['Objects'].all_tiles())
+    tile_object._value = end_gid + 2
+    map.tilesets[0][5].terrain_indices = [-1, 99, -1, -1]
+
+    problems = map.check_consistency(report=True)
+    assert problems == [
+        'Layer Building, tile (3, 0): GID %s not in map' % end_gid,
+        'Layer Building, tile (5, 1): GID %s not in map' % (end_gid + 1),
+        'Layer Objects, object at %s: GID %s not in map' % (
+            tile_object.pos, end_gid + 2),
+        'Tileset Desert, tile 5: bad terrain index 99',
+    ]
+    with pytest.raises(AssertionError) as excinfo:
+        map.check_consistency()
+    assert str(excinfo.value) == problems[0] + ' (and 3 more problems)'
+
+
+def test_map_tile_slots(desert):
+    tile = desert.layers[0][1, 2]
+    assert not hasattr(tile, '__dict__')
+    with pytest.raises(AttributeError):
+        tile.foo = 1
+    assert tile.map is desert
+    assert tile.tile_size == desert.tile_size
+    assert tile.pixel_pos == (32, 96)
+
+
+def test_tile_cursor(desert):
+    layer = desert.layers[0]
+    cursor = layer.cursor()
+    assert cursor.pos == (0, 0)
+    for y in range(desert.height):
+        for x in range(desert.width):
+            cursor.move_to(x, y)
+            assert cursor.value == layer[x, y].value
+    assert cursor == layer[-1, -1]
+    cursor.pos = 1, 2
+    assert cursor.pos == (1, 2)
+    assert cursor.gid == 30
+    cursor.move_to(-1, -2)
+    assert cursor.pos == (desert.width - 1, desert.height - 2)
+    cursor.gid = 5
+    cursor.hflip()
+    assert layer[-1, -2].value == 0x80000005
+    assert layer.cursor((3, 4)).pos == (3, 4)
+    with pytest.raises(TypeError):
+        hash(cursor)
+
+
+@pytest.mark.skipif(not os.environ.get('PYTMXLIB_TEST_BENCHMARK'),
+                    reason='Set PYTMXLIB_TEST_BENCHMARK=yes to run benchmarks')
+def test_tile_access_benchmark(desert):
+    import timeit
+    layer = desert.layers[0]
+    cursor = layer.cursor()
+
+    def cursor_gid():
+        cursor.move_to(3, 4)
+        return cursor.gid
+
+    number = 100000
+    for name, func in [
+            ('layer[x, y]', lambda: layer[3, 4]),
+            ('layer[x, y].gid', lambda: layer[3, 4].gid),
+            ('layer[x, y].pixel_pos', lambda: layer[3, 4].pixel_pos),
+            ('layer.value_at((x, y))', lambda: layer.value_at((3, 4))),
+            ('cursor.move_to(x, y); cursor.gid', cursor_gid)]:
+        time = min(timeit.repeat(func, number=number, repeat=5))
+        print('%s: %.2f us' % (name, time / number * 1e6))
+
+
+def _model_objects(map):
+    """All TilesetTiles, MapTiles, objects, terrains & draw commands of a map
+    """
+    objects = list(map.all_tiles())
+    objects.extend(map.all_objects())
+    for tileset in map.tilesets:
+        objects.extend(tileset)
+        objects.extend(tileset.terrains)
+    for layer in map.layers:
+        if isinstance(layer, tmxlib.TileLayer):
+            objects.extend(layer.generate_draw_commands())
+    objects.extend(command.image for command in objects
+                   if isinstance(command, tmxlib.draw.DrawImageCommand))
+    return objects
+
+
+def test_model_slots(desert):
+    objects = _model_objects(desert)
+    objects += _model_objects(
+        tmxlib.Map.open(get_test_filename('objects.tmx')))
+    types = set(type(obj) for obj in objects)
+    assert types >= set([
+        tmxlib.MapTile, tmxlib.tileset.GridTilesetTile,
+        tmxlib.terrain.Terrain, tmxlib.RectangleObject, tmxlib.EllipseObject,
+        tmxlib.PolygonObject, tmxlib.PolylineObject,
+        tmxlib.draw.DrawImageCommand, tmxlib.image_base.ImageRegion])
+    for obj in objects:
+        assert not hasattr(obj, '__dict__'), obj
+
+
+def test_tileset_tile_cache(desert):
+    import gc
+    tileset = desert.tilesets[0]
+    tile = tileset[3]
+    assert tileset[3] is tile
+    assert tileset[-1] is tileset[len(tileset) - 1]
+    del tile
+    gc.collect()
+    assert 3 not in tileset.tiles
+    assert tileset[3].number == 3
+
+
+def test_tile_image_cache(desert, monkeypatch):
+    tileset = desert.tilesets[0]
+    image = tileset.tile_image(9)
+    assert tileset.tile_image(9) is image
+    assert tileset[9].image is image
+    assert (image.x, image.y, image.size) == (34, 34, (32, 32))
+
+    # Changing the tile geometry invalidates the cache
+    tileset.spacing = 0
+    assert (tileset[9].image.x, tileset[9].image.y) == (33, 33)
+    tileset.margin = 0
+    assert (tileset[9].image.x, tileset[9].image.y) == (32, 32)
+    tileset.tile_width = 16
+    assert tileset[9].image.size == (16, 32)
+    assert (tileset[9].image.x, tileset[9].image.y) == (144, 0)
+    tileset.image = tileset.image[0:64, 0:96]
+    assert tileset.column_count == 4
+    assert (tileset[9].image.x, tileset[9].image.y) == (16, 64)
+
+    # The cache is bounded
+    def cached():
+        return (list(tileset._recent_tile_images) +
+                list(tileset._old_tile_images))
+
+    for size in 4, 5, 2:
+        monkeypatch.setattr(tileset, 'tile_image_cache_size', size)
+        for number in range(len(tileset)):
+            assert tileset.tile_image(number) is tileset.tile_image(number)
+            assert len(cached()) <= size
+        assert len(tileset) - 1 in cached()
+    for size in 1, 0:
+        monkeypatch.setattr(tileset, 'tile_image_cache_size', size)
+        tileset._clear_tile_images()
+        for number in range(len(tileset)):
+            tileset.tile_image(number)
+        assert cached() == []
+
+
+@pytest.mark.parametrize('protocol', range(pickle.HIGHEST_PROTOCOL + 1))
+def test_pickle(protocol):
+    map = tmxlib.Map((4, 4), (32, 32))
+    image = tmxlib.image.open(get_test_filename('tmw_desert_spacing.png'))
+    tileset = tmxlib.ImageTileset('Desert', (32, 32), image, 1, 1)
+    map.tilesets.append(tileset)
+    tileset.terrains.append_new('Sand', tileset[29])
+    layer = map.add_layer('Ground')
+    layer[1, 2] = 30
+    layer[2, 3] = tileset[4]
+    objects = map.add_object_layer('Objects')
+    objects.append(tmxlib.RectangleObject(
+        objects, (10, 20), value=5, name='tile', type='t'))
+    objects.append(tmxlib.EllipseObject(objects, (3, 4), pixel_size=(5, 6)))
+    objects.append(tmxlib.PolygonObject(objects, (1, 2), points=[(3, 4)]))
+    objects[0].properties['key'] = 'value'
+
+    loaded = pickle.loads(pickle.dumps(map, protocol))
+    assert list(loaded.layers[0].data) == list(layer.data)
+    assert loaded.tilesets[0].first_gid(loaded) == 1
+    assert loaded.tilesets[0].terrains['Sand'].tile.number == 29
+    assert loaded.tilesets[0].terrains['Sand'].tileset is loaded.tilesets[0]
+    rect, ellipse, polygon = loaded.layers['Objects']
+    assert (rect.pixel_pos, rect.value, rect.name, rect.type) == (
+        (10, 20), 5, 'tile', 't')
+    assert rect.properties == {'key': 'value'}
+    assert rect.layer is loaded.layers['Objects']
+    assert ellipse.pixel_size == (5, 6)
+    assert polygon.points == [(3, 4)]
+
+    tile = pickle.loads(pickle.dumps(layer[1, 2], protocol))
+    assert (tile.pos, tile.value, tile.pixel_pos) == ((1, 2), 30, (32, 96))
+    assert tile.map is tile.layer.map
+
+    region = pickle.loads(pickle.dumps(tileset[4].image, protocol))
+    assert (region.top_left, region.size) == ((133, 1), (32, 32))
+
+    command = tmxlib.draw.DrawImageCommand(region, (3, 4), 0.5)
+    command = pickle.loads(pickle.dumps(command, protocol))
+    assert (command.pos, command.opacity) == ((3, 4), 0.5)
+
+
+def _instance_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+@pytest.mark.skipif(not os.environ.get('PYTMXLIB_TEST_BENCHMARK'),
+                    reason='Set PYTMXLIB_TEST_BENCHMARK=yes to run benchmarks')
+def test_model_memory_benchmark():
+    # Each test map is small; report the memory its model objects would take
+    # in a map `scale` times larger
+    scale = 1000
+    for filename in sorted(os.listdir(base_path)):
+        if not filename.endswith('.tmx'):
+            continue
+        map = tmxlib.Map.open(get_test_filename(filename))
+        objects = _model_objects(map)
+        sizes = collections.Counter()
+        for obj in objects:
+            sizes[type(obj).__name__] += _instance_size(obj)
+        print('%s: %s objects, %.1f MiB at x%s' % (
+            filename, len(objects) * scale,
+            sum(sizes.values()) * scale / 2 ** 20, scale))
+        for name, size in sorted(sizes.items()):
+            print('    %s: %.1f MiB' % (name, size * scale / 2 ** 20))
+
+
 def test_layer_nonzero():
     map = desert()
     assert map.layers[0]
@@ -613,6 +1105,281 @@ def test_layer_nonzero():
     assert layer
 
 
+def test_object_layer_columns(monkeypatch):
+    filename = get_test_filename('objects.tmx')
+    map = tmxlib.Map.open(filename)
+    monkeypatch.setattr(tmxlib.ObjectLayer, 'default_storage', 'columns')
+    columns_map = tmxlib.Map.open(filename)
+    layer = columns_map.layers[0]
+    assert map.layers[0].storage == 'objects'
+    assert map.layers[0].columns is None
+    assert layer.storage == 'columns'
+    assert len(layer.columns) == len(layer) == len(map.layers[0]) == 5
+
+    # Loading fills the columns without creating objects
+    assert len(layer.columns._proxies) == 0
+    assert_xml_compare(map.dump(), columns_map.dump())
+    assert len(layer.columns._proxies) == 0
+
+    for obj, expected in zip(layer, map.layers[0]):
+        assert isinstance(obj, type(expected))
+        assert not hasattr(obj, '__dict__')
+        assert obj.layer is layer
+        for attr in ('objtype', 'pixel_pos', 'name', 'type', 'properties'):
+            assert getattr(obj, attr) == getattr(expected, attr)
+    assert [o.to_dict() for o in layer] == [o.to_dict() for o in map.layers[0]]
+
+    # Objects write to their row
+    obj = layer[1]
+    assert layer[1] is obj
+    obj.pixel_pos = 1.5, 3
+    obj.name = 'New name'
+    obj.properties['key'] = 'value'
+    obj.pixel_size = 7, 8
+    assert layer.columns.xs[1] == 1.5
+    assert obj.pixel_pos == (1.5, 3)
+    assert layer['New name'] is obj
+    assert layer[1].properties == {'key': 'value'}
+    assert layer[1].pixel_size == (7, 8)
+    obj.pixel_pos = 2, 3
+    xml = columns_map.dump()
+    assert b'name="New name"' in xml
+    assert b'x="2"' in xml
+
+    # Objects survive removal from the layer, and follow their rows
+    first, last = layer[0], layer[-1]
+    assert layer.pop(1) is obj
+    assert obj.name == 'New name' and obj.pixel_size == (7, 8)
+    assert obj not in layer
+    assert layer[0] is first and layer[-1] is last and len(layer) == 4
+    layer.insert(0, obj)
+    assert layer[0] is obj and layer[1] is first and layer[-1] is last
+    assert obj in layer
+    layer.move(0, 2)
+    assert layer[2] is obj
+
+    # Other objects are copied
+    new = tmxlib.PolylineObject(layer, (3, 4), points=[(1, 2), (3, 4)])
+    layer.append(new)
+    assert layer[-1] is not new
+    assert layer[-1].points == [(1, 2), (3, 4)]
+    assert layer[-1].objtype == 'polyline'
+    layer[-1] = tmxlib.RectangleObject(layer, (5, 6), value=2)
+    assert layer[-1].objtype == 'tile'
+    assert layer[-1].value == 2
+    with pytest.raises(ValueError):
+        layer.append(tmxlib.RectangleObject(map.layers[0], (0, 0), value=2))
+    assert len(layer) == 6
+
+    del layer[1:3]
+    assert len(layer) == 4
+    assert layer[0] is first
+    layer[:] = []
+    assert not layer
+    assert obj.pixel_pos == (2, 3)
+
+
+@pytest.mark.parametrize('object_storage', ['objects', 'columns'])
+def test_object_index(object_storage):
+    map = tmxlib.Map((10, 10), (32, 32))
+    layer = tmxlib.ObjectLayer(map, 'Objects', storage=object_storage)
+    map.layers.append(layer)
+    layer.append(tmxlib.EllipseObject(layer, (0, 32), pixel_size=(32, 32),
+        name='a'))
+    layer.append(tmxlib.EllipseObject(layer, (32, 32), pixel_size=(32, 32),
+        name='b'))
+    layer.append(tmxlib.PolygonObject(
+        layer, (100, 100), points=[(0, 0), (50, -10), (20, 30)], name='c'))
+    layer.append(tmxlib.PolylineObject(
+        layer, (200, 300), points=[(0, 0), (0, 0)], name='d'))
+
+    def names(objects):
+        return sorted(o.name for o in objects)
+
+    assert layer[0].pixel_bbox == (0, 0, 32, 32)
+    assert layer[2].pixel_bbox == (100, 90, 50, 40)
+    assert layer[3].pixel_bbox == (200, 300, 0, 0)
+
+    assert names(layer.objects_at((10, 10))) == ['a']
+    # Touching edges count
+    assert names(layer.objects_at((32, 0))) == ['a', 'b']
+    assert names(layer.objects_at((200, 300))) == ['d']
+    assert names(layer.objects_at((300, 300))) == []
+    assert names(layer.objects_in_rect((0, 0, 100, 90))) == ['a', 'b', 'c']
+    assert names(layer.objects_in_rect((65, 0, 34, 89))) == []
+    assert names(layer.objects_in_rect((0, 0, 320, 320))) == [
+        'a', 'b', 'c', 'd']
+    assert names(layer.nearest((40, 10))) == ['b']
+    assert [o.name for o in layer.nearest((150, 150), 3)] == ['c', 'b', 'd']
+    assert layer.nearest((0, 0), 0) == []
+    assert names(layer.nearest((0, 0), 10)) == ['a', 'b', 'c', 'd']
+
+    # The index follows changes to objects
+    layer[0].pixel_pos = 250, 250
+    assert names(layer.objects_at((10, 10))) == []
+    assert names(layer.objects_at((260, 240))) == ['a']
+    layer['b'].pixel_size = 8, 8
+    assert names(layer.objects_at((50, 10))) == []
+    assert names(layer.objects_at((40, 30))) == ['b']
+    layer['c'].points = [(0, 0), (1, 1)]
+    assert names(layer.objects_in_rect((110, 90, 40, 5))) == []
+    assert names(layer.objects_at((101, 101))) == ['c']
+
+    # ... and to the layer
+    obj = layer.pop(0)
+    assert names(layer.objects_at((260, 240))) == []
+    layer.insert(-1, tmxlib.EllipseObject(
+        layer, (300, 300), pixel_size=(10, 10), name='e'))
+    assert [o.name for o in layer] == ['b', 'c', 'e', 'd']
+    assert names(layer.objects_at((305, 295))) == ['e']
+    layer['e'] = tmxlib.EllipseObject(layer, (0, 10), pixel_size=(10, 10),
+        name='f')
+    assert names(layer.objects_at((305, 295))) == []
+    assert names(layer.objects_at((5, 5))) == ['f']
+    del layer['f']
+    assert names(layer.objects_at((5, 5))) == []
+    layer[:1] = [obj]
+    assert names(layer.objects_at((260, 240))) == ['a']
+    assert names(layer.objects_at((40, 30))) == []
+
+    # ... including changes that are rolled back
+    with pytest.raises(ZeroDivisionError):
+        with layer.modification_context():
+            layer.append(tmxlib.EllipseObject(
+                layer, (0, 100), pixel_size=(10, 10), name='g'))
+            1 / 0
+    expected = names(o for o in layer if o.name == 'g')
+    assert names(layer.objects_at((5, 95))) == expected
+    # (as used by generate_draw_commands)
+    assert names(layer._in_layer_order(layer.objects_at((5, 95)))) == expected
+
+
+def test_object_index_columns(desert):
+    layer = tmxlib.ObjectLayer(desert, 'Objects', storage='columns')
+    desert.layers.append(layer)
+    columns = layer.columns
+    for i in range(1000):
+        columns.add_row('ellipse', (i % 40 * 10, i // 40 * 10 + 5),
+                        pixel_size=(5, 5), name=str(i))
+    columns.add_row('rectangle', (3, 300), value=0x20000001)
+    columns.add_row('polygon', (100, 100), points=[(0, 0), (5, -5)])
+    assert columns.pixel_bbox(1000) == layer[1000].pixel_bbox
+    assert columns.pixel_bbox(1001) == layer[1001].pixel_bbox
+
+    # Objects are only created for the rows that are found
+    found = layer.objects_at((12, 12))
+    assert [o.name for o in found] == ['41']
+    assert len(columns._proxies) == 1
+    del found
+
+    def check():
+        for x, y, width, height in [(0, 0, 50, 50), (100, 95, 10, 10),
+                                    (0, 290, 40, 20)]:
+            expected = []
+            for row in range(len(columns)):
+                left, top, w, h = columns.pixel_bbox(row)
+                if (left <= x + width and x <= left + w and
+                        top <= y + height and y <= top + h):
+                    expected.append(row)
+            found = layer.objects_in_rect((x, y, width, height))
+            assert sorted(o._row for o in found) == expected
+
+    # Changes to rows keep the index in step
+    check()
+    layer.append(tmxlib.EllipseObject(layer, (20, 30), pixel_size=(10, 10)))
+    check()
+    layer[5] = tmxlib.EllipseObject(layer, (0, 310), pixel_size=(10, 10))
+    check()
+    del layer[-1]
+    check()
+    layer.insert(0, tmxlib.EllipseObject(layer, (98, 98), pixel_size=(1, 1)))
+    check()
+    del layer[3]
+    check()
+    layer[7].pixel_pos = 101, 101
+    check()
+    layer[1000].value = 0
+    layer[1000].pixel_size = 50, 50
+    check()
+
+
+@pytest.mark.parametrize('object_storage', ['objects', 'columns'])
+def test_object_layer_names(object_storage):
+    map = tmxlib.Map((10, 10), (32, 32))
+    layer = tmxlib.ObjectLayer(map, 'Objects', storage=object_storage)
+    map.layers.append(layer)
+    for i in range(100):
+        layer.append(tmxlib.EllipseObject(
+            layer, (i, i), pixel_size=(1, 1), name='obj%s' % i))
+    assert layer['obj42'].pixel_pos == (42, 42)
+    assert 'obj99' in layer
+    assert 'obj100' not in layer
+    if object_storage == 'columns':
+        # Building the index doesn't create objects
+        rows = []
+        make_proxy = layer.columns._proxy
+        def counting_proxy(row):
+            rows.append(row)
+            return make_proxy(row)
+        layer.columns._proxy = counting_proxy
+        layer._name_index = None
+        assert layer['obj42'].pixel_pos == (42, 42)
+        assert rows == [42]
+        del layer.columns._proxy
+    layer.append(tmxlib.EllipseObject(
+        layer, (0, 0), pixel_size=(1, 1), name='obj100'))
+    assert layer['obj100'].pixel_pos == (0, 0)
+
+    # Renamed objects are found by their new name
+    layer['obj99'].name = 'obj1'
+    assert layer['obj1'].pixel_pos == (1, 1)
+    layer['obj1'].name = 'spawn'
+    assert layer['obj1'].pixel_pos == (99, 99)
+    assert layer['spawn'].pixel_pos == (1, 1)
+    assert 'obj99' not in layer
+    del layer[0]
+    assert layer['spawn'] is layer[0]
+
+    # Renamed layers too
+    map.layers[0].name = 'Renamed'
+    assert map.layers['Renamed'] is layer
+    assert 'Objects' not in map.layers
+
+
+@pytest.mark.parametrize('object_storage', ['objects', 'columns'])
+def test_object_layer_draw_rect(desert, object_storage):
+    layer = tmxlib.ObjectLayer(desert, 'Objects', storage=object_storage)
+    desert.layers.append(layer)
+    for i in range(20):
+        layer.append(tmxlib.RectangleObject(
+            layer, (i * 16, 64), value=i + 1, name=str(i)))
+    layer.insert(0, layer[15])
+
+    def drawn(rect):
+        return [cmd.pos for cmd in layer.generate_draw_commands(rect)]
+
+    assert drawn(None) == [(240, 32)] + [(i * 16, 32) for i in range(20)]
+    assert drawn((200, 40, 50, 5)) == [(240, 32)] + [
+        (i * 16, 32) for i in range(11, 16)]
+    assert drawn((0, 65, 100, 100)) == []
+    layer.pop(0)
+    assert drawn((200, 40, 50, 5)) == [(i * 16, 32) for i in range(11, 16)]
+
+    # Changing the tile of an object changes its size
+    big = tmxlib.ImageTileset('Big', (64, 64), image=desert.tilesets[0].image)
+    desert.tilesets.append(big)
+    assert drawn((100, 10, 1, 1)) == []
+    layer['3'].value = big[0]
+    assert layer['3'].pixel_bbox == (48, 0, 64, 64)
+    assert [o.name for o in layer.objects_at((100, 10))] == ['3']
+    assert drawn((100, 10, 1, 1)) == [(48, 0)]
+
+
+def test_bad_object_layer_storage(desert):
+    with pytest.raises(ValueError):
+        tmxlib.ObjectLayer(desert, 'New layer', storage='bad')
+
+
 def test_terrains(desert):
     tileset = desert.tilesets[0]
     assert [t.name for t in tileset.terrains] == [
@@ -708,3 +1475,91 @@ if os.path.exists(tiled_example_base):
 else:  # pragma: no cover
     def test_load_tiled_examples():
         pytest.skip("Tiled examples not found (run git submodule init/update)")
+
+
+def test_layer_storage(desert, storage):
+    data = [0] * (desert.width * desert.height)
+    data[5] = 0x80000001
+    layer = tmxlib.TileLayer(desert, 'New layer', data=data, storage=storage)
+    assert layer.storage == storage
+    assert layer.data.tolist() == data
+    assert layer[5, 0].gid == 1
+    assert layer[5, 0].flipped_horizontally
+
+    layer[1, 1] = 2
+    assert layer.value_at((1, 1)) == 2
+
+    layer.data = data
+    assert layer.storage == storage
+    assert layer[1, 1].value == 0
+    assert layer.to_dict()['data'] == data
+
+    with pytest.raises(ValueError):
+        layer.data = data[1:]
+
+
+def test_layer_as_array(desert, numpy, storage):
+    data = [0] * (desert.width * desert.height)
+    data[5] = 0x80000001
+    layer = tmxlib.TileLayer(desert, 'New layer', data=data, storage=storage)
+    layer[1, 1] = 2
+    array = layer.as_array()
+    assert array.shape == (desert.height, desert.width)
+    assert array[1, 1] == 2
+    assert array[0, 5] == 0x80000001
+    array[2, 3] = 4
+    assert layer[3, 2].value == 4
+    assert layer.value_at((3, 2)) == 4
+
+    new_array = layer.as_array().copy()
+    new_array[-1, -2] = 3
+    layer.data = new_array
+    assert layer.storage == storage
+    assert len(layer.data) == desert.width * desert.height
+    assert layer[-2, -1].value == 3
+    assert layer[3, 2].value == 4
+    assert layer.as_array().shape == (desert.height, desert.width)
+
+    with pytest.raises(ValueError):
+        layer.data = new_array[1:]
+
+
+def test_numpy_storage(numpy, monkeypatch):
+    monkeypatch.setattr(tmxlib.TileLayer, 'default_storage', 'numpy')
+    map = tmxlib.Map.open(get_test_filename('desert.tmx'))
+    layer = map.layers[0]
+    assert layer.data.dtype == numpy.uint32
+    assert layer.as_array().base is layer.data
+    assert layer[1, 2].value == 30
+    assert layer.as_array()[2, 1] == 30
+    assert isinstance(layer[1, 2].value, int)
+    assert map.add_tile_layer('new').data.dtype == numpy.uint32
+
+
+def test_bad_layer_storage(desert):
+    with pytest.raises(ValueError):
+        tmxlib.TileLayer(desert, 'New layer', storage='bad')
+
+
+def test_compact_storage(desert):
+    size = desert.width * desert.height
+    layer = tmxlib.TileLayer(desert, 'New layer', storage='compact')
+    assert layer.data.itemsize == 4
+    assert layer.nbytes == size * 4
+    layer[0, 0] = 0xE0000001
+    assert layer[0, 0].value == 0xE0000001
+    assert layer[0, 0].gid == 1
+
+    array_layer = tmxlib.TileLayer(desert, 'New layer', storage='array')
+    assert array_layer.nbytes == size * array_layer.data.itemsize
+    array_layer.data = layer.data
+    assert array_layer.data.typecode == 'L'
+    assert array_layer[0, 0].value == 0xE0000001
+
+
+def test_open_tileset_fileobj():
+    filename = get_test_filename('perspective_walls.tsx')
+    with open(filename, 'rb') as fileobj:
+        tileset = tmxlib.ImageTileset.open(fileobj)
+    assert tileset.name == 'perspective_walls'
+    assert tileset.base_path == os.path.dirname(filename)